@@ -1,17 +1,165 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, session, send_file, send_from_directory
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 import sqlite3
 import os
 from datetime import datetime, timedelta
 import jwt
 import json
+import hashlib
+import hmac
+import mimetypes
+import tempfile
+import time
+import threading
 from functools import wraps
+from page_cache import SharedPageCache
+from password_hasher import PasswordHasher, HasherBusy
+from write_buffer import CoalescingWriter
+from replication import (
+    REPLICATION_TOKEN_HEADER, PrimaryUnavailable, SnapshotSync,
+    create_snapshot, database_version, forward_request, post_to_primary, readonly_uri
+)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_secret_key_here'
 app.config['UPLOAD_FOLDER'] = './mangas'
 app.config['DATABASE'] = 'manga_reader.db'
+app.config['PAGE_CACHE_MB'] = int(os.environ.get('PAGE_CACHE_MB', '128'))
+app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', '8192'))
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+# Hashes simultáneos en todo el servidor (no por worker): por defecto, la mitad de los núcleos
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '16'))
+app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+app.config['PROGRESS_FLUSH_INTERVAL'] = float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '2'))
+
+# Replicación: 'primary' ejecuta importaciones y escrituras; 'replica' sirve en
+# solo lectura desde instantáneas descargadas del primario
+app.config['ROLE'] = os.environ.get('LECTORM_ROLE', 'primary')
+app.config['PRIMARY_URL'] = os.environ.get('LECTORM_PRIMARY_URL', 'http://127.0.0.1:5000')
+app.config['REPLICATION_TOKEN'] = os.environ.get('LECTORM_REPLICATION_TOKEN', '')
+app.config['REPLICA_DATABASE'] = os.environ.get('LECTORM_REPLICA_DB', 'manga_reader.replica.db')
+app.config['SNAPSHOT_INTERVAL'] = float(os.environ.get('LECTORM_SNAPSHOT_INTERVAL', '30'))
+
+# Un año: las URLs /page/<hash> son direccionadas por contenido
+PAGE_BLOB_MAX_AGE = 365 * 24 * 60 * 60
+
+# Presupuesto de la validación rápida de directorios
+VALIDATION_TIME_BUDGET = 0.5  # segundos
+VALIDATION_ENTRY_BUDGET = 5000
+VALIDATION_SAMPLE_FOLDERS = 20
+VALIDATION_CACHE_SIZE = 32
+# Estado de los conteos en archivos para que cualquier worker pueda consultarlo
+VALIDATION_SCAN_DIR = os.environ.get(
+    'LECTORM_SCAN_DIR', os.path.join(tempfile.gettempdir(), 'lectorm-scans')
+)
+VALIDATION_SCAN_STALE = 30  # segundos sin latido: el worker que contaba murió
+VALIDATION_SCAN_WRITE_INTERVAL = 0.5
+VALIDATION_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+# Caché de páginas calientes; se crea al importar el módulo para que los
+# workers creados por fork compartan la misma arena
+page_cache = None
+if app.config['PAGE_CACHE_MB'] > 0:
+    page_cache = SharedPageCache(
+        app.config['PAGE_CACHE_MB'] * 1024 * 1024,
+        max_entries=app.config['PAGE_CACHE_MAX_ENTRIES']
+    )
+
+# Hash de contraseñas fuera de los hilos que sirven páginas
+password_hasher = PasswordHasher(
+    method=app.config['PASSWORD_HASH_METHOD'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    timeout=app.config['PASSWORD_HASH_TIMEOUT']
+)
+
+def is_replica():
+    return app.config['ROLE'] == 'replica'
+
+# Posiciones de lectura: en una réplica se fusionan por usuario y manga y se
+# envían al primario en lotes; el primario las escribe al momento
+def write_progress_batch(batch):
+    """Guardar un lote de posiciones de lectura en una sola transacción"""
+    rows = [
+        [user_id, manga_id, page, total_pages, str(updated_at)]
+        for (user_id, manga_id), (page, total_pages, updated_at) in batch.items()
+    ]
+    if is_replica():
+        post_to_primary(app.config['PRIMARY_URL'], app.config['REPLICATION_TOKEN'],
+                        '/api/replication/writes', {'progress': rows})
+        return
+    
+    with get_db() as conn:
+        conn.executemany('''
+            INSERT INTO reading_progress (user_id, manga_id, page, total_pages, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, manga_id) DO UPDATE SET
+                page = excluded.page,
+                total_pages = COALESCE(excluded.total_pages, reading_progress.total_pages),
+                updated_at = excluded.updated_at
+            WHERE excluded.updated_at >= reading_progress.updated_at
+        ''', rows)
+
+def write_views_batch(batch):
+    """Sumar un lote de vistas acumuladas por manga"""
+    rows = [
+        [count, str(last_viewed), manga_id]
+        for manga_id, (count, last_viewed) in batch.items()
+    ]
+    if is_replica():
+        post_to_primary(app.config['PRIMARY_URL'], app.config['REPLICATION_TOKEN'],
+                        '/api/replication/writes', {'views': rows})
+        return
+    
+    with get_db() as conn:
+        conn.executemany(
+            'UPDATE mangas SET views = views + ?, last_viewed = ? WHERE id = ?',
+            rows
+        )
+
+progress_writer = CoalescingWriter(write_progress_batch, interval=app.config['PROGRESS_FLUSH_INTERVAL'])
+view_writer = CoalescingWriter(
+    write_views_batch,
+    interval=app.config['PROGRESS_FLUSH_INTERVAL'],
+    merge=lambda old, new: (old[0] + new[0], max(old[1], new[1]))
+)
+
+def library_fingerprint():
+    """Identificador de la biblioteca: cambia al reimportar o al cambiar de directorio"""
+    with get_db() as conn:
+        rows = conn.execute(
+            "SELECT key, value FROM settings WHERE key IN ('library_version', 'manga_directory') ORDER BY key"
+        ).fetchall()
+    return tuple((row['key'], row['value']) for row in rows)
+
+_snapshot_library = None
+
+def on_snapshot_swap():
+    """Vaciar la caché de páginas solo si la nueva instantánea cambió la biblioteca
+
+    La instantánea cambia con cualquier escritura del primario (vistas,
+    progreso, logins); vaciar la caché en cada una la dejaría siempre fría.
+    """
+    global _snapshot_library
+    fingerprint = library_fingerprint()
+    if fingerprint != _snapshot_library:
+        _snapshot_library = fingerprint
+        if page_cache:
+            page_cache.clear()
+
+# En réplica, la instantánea se renueva en segundo plano; si cambia la
+# biblioteca, las rutas de las páginas pueden apuntar a otros archivos
+snapshot_sync = None
+if is_replica():
+    snapshot_sync = SnapshotSync(
+        app.config['PRIMARY_URL'],
+        app.config['REPLICATION_TOKEN'],
+        app.config['REPLICA_DATABASE'],
+        interval=app.config['SNAPSHOT_INTERVAL'],
+        on_swap=on_snapshot_swap
+    )
 
 # Verificar que el directorio de mangas existe
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -20,7 +168,10 @@ if not os.path.exists(app.config['UPLOAD_FOLDER']):
 
 def get_db():
     """Obtener conexión a la base de datos"""
-    conn = sqlite3.connect(app.config['DATABASE'])
+    if is_replica():
+        conn = sqlite3.connect(readonly_uri(app.config['REPLICA_DATABASE']), uri=True)
+    else:
+        conn = sqlite3.connect(app.config['DATABASE'])
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -74,8 +225,58 @@ def init_db():
                 FOREIGN KEY (manga_id) REFERENCES mangas (id),
                 UNIQUE(user_id, manga_id)
             );
+            
+            CREATE INDEX IF NOT EXISTS idx_favorites_user_created
+                ON favorites (user_id, created_at DESC, manga_id);
+            
+            CREATE TABLE IF NOT EXISTS reading_progress (
+                user_id INTEGER NOT NULL,
+                manga_id INTEGER NOT NULL,
+                page INTEGER NOT NULL,
+                total_pages INTEGER,
+                updated_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (user_id, manga_id),
+                FOREIGN KEY (user_id) REFERENCES users (id),
+                FOREIGN KEY (manga_id) REFERENCES mangas (id)
+            );
+            
+            -- Índice de cobertura para la estantería "continuar leyendo"
+            CREATE INDEX IF NOT EXISTS idx_reading_progress_user_updated
+                ON reading_progress (user_id, updated_at DESC, manga_id, page, total_pages);
+            
+            CREATE TABLE IF NOT EXISTS blobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                content_hash TEXT UNIQUE NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                path TEXT NOT NULL
+            );
+            
+            CREATE TABLE IF NOT EXISTS pages (
+                manga_id TEXT NOT NULL,
+                page_number INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                blob_id INTEGER NOT NULL,
+                PRIMARY KEY (manga_id, page_number),
+                FOREIGN KEY (blob_id) REFERENCES blobs (id)
+            );
+            
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                content_hash TEXT NOT NULL
+            );
         ''')
 
+def decode_user_token(token):
+    """Devolver el user_id de un token JWT válido o None"""
+    try:
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        return data['user_id']
+    except:
+        return None
+
 def token_required(f):
     """Decorador para verificar token JWT"""
     @wraps(f)
@@ -83,14 +284,18 @@ def token_required(f):
         token = request.cookies.get('token')
         if not token:
             return redirect(url_for('login'))
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-        except:
+        current_user_id = decode_user_token(token)
+        if current_user_id is None:
             return redirect(url_for('login'))
         return f(current_user_id, *args, **kwargs)
     return decorated
 
+def auth_busy_response():
+    """Respuesta rápida cuando el pool de hash está saturado"""
+    response = jsonify({'message': 'Servidor ocupado, inténtalo de nuevo en unos segundos'})
+    response.headers['Retry-After'] = '2'
+    return response, 503
+
 def api_token_required(f):
     """Decorador para verificar token en rutas API"""
     @wraps(f)
@@ -98,14 +303,25 @@ def api_token_required(f):
         token = request.cookies.get('token') or request.headers.get('x-access-token')
         if not token:
             return jsonify({'message': 'No token provided'}), 403
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user_id = data['user_id']
-        except:
+        current_user_id = decode_user_token(token)
+        if current_user_id is None:
             return jsonify({'message': 'Unauthorized'}), 401
         return f(current_user_id, *args, **kwargs)
     return decorated
 
+def replication_token_required(f):
+    """Decorador para los endpoints internos de replicación del primario"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get(REPLICATION_TOKEN_HEADER, '')
+        expected = app.config['REPLICATION_TOKEN']
+        if is_replica() or not expected:
+            return jsonify({'error': 'Replicación no disponible en este nodo'}), 404
+        if not hmac.compare_digest(token, expected):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
 # Funciones de configuración
 def get_setting(key, default_value=None):
     """Obtener un valor de configuración"""
@@ -141,12 +357,315 @@ def init_default_settings():
     """Inicializar configuraciones por defecto"""
     default_settings = [
         ('manga_directory', app.config['UPLOAD_FOLDER'], 'Directorio donde se almacenan los mangas'),
+        ('content_dedup', 'false', 'Calcular hash de contenido al importar para deduplicar páginas'),
     ]
     
     for key, value, description in default_settings:
         if not get_setting(key):
             set_setting(key, value, description)
 
+# Validación de directorios
+# Cada conteo se identifica por ruta y mtime del directorio y guarda su estado
+# en VALIDATION_SCAN_DIR/<id>.json; así cualquier worker de gunicorn puede
+# responder al progreso y ninguno repite un conteo que ya está en marcha.
+class ScanControl:
+    """Cancelación y latido de un conteo, compartidos entre workers mediante archivos"""
+    
+    CHECK_INTERVAL = 0.2
+    
+    def __init__(self, scan_id):
+        self.cancel_path = directory_scan_path(scan_id, '.cancel')
+        self.state_path = directory_scan_path(scan_id)
+        self._checked = 0.0
+        self._cancelled = False
+    
+    def is_set(self):
+        now = time.monotonic()
+        if not self._cancelled and now - self._checked > self.CHECK_INTERVAL:
+            self._checked = now
+            self._cancelled = os.path.exists(self.cancel_path)
+            # Latido: aunque una carpeta tarde mucho, el conteo sigue vivo
+            try:
+                os.utime(self.state_path)
+            except OSError:
+                pass
+        return self._cancelled
+
+def is_image_name(name):
+    """Comprobar si un nombre de archivo tiene extensión de imagen"""
+    return os.path.splitext(name.lower())[1] in VALIDATION_IMAGE_EXTENSIONS
+
+def count_folder_images(path, cancel=None, deadline=None, max_entries=None):
+    """Contar imágenes de una carpeta de manga con os.scandir
+
+    Devuelve (imágenes, entradas visitadas, completa). Con deadline o
+    max_entries el recorrido se corta a mitad de carpeta y completa es False.
+    """
+    count = 0
+    visited = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if cancel is not None and cancel.is_set():
+                return count, visited, False
+            if (max_entries is not None and visited >= max_entries) or \
+                    (deadline is not None and time.monotonic() > deadline):
+                return count, visited, False
+            visited += 1
+            if is_image_name(entry.name) and entry.is_file():
+                count += 1
+    return count, visited, True
+
+def estimate_directory(directory):
+    """Estimar carpetas e imágenes sin superar el presupuesto de tiempo y entradas
+
+    Si el listado o alguna carpeta muestreada se corta por el presupuesto, las
+    cifras son un mínimo (lower_bound) y no una estimación centrada.
+    """
+    deadline = time.monotonic() + VALIDATION_TIME_BUDGET
+    budget = VALIDATION_ENTRY_BUDGET
+    folders = []
+    complete = True
+    
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if budget <= 0 or time.monotonic() > deadline:
+                complete = False
+                break
+            budget -= 1
+            try:
+                if entry.is_dir():
+                    folders.append(entry.path)
+            except OSError:
+                continue
+    
+    # Muestrear carpetas repartidas uniformemente y extrapolar; una carpeta
+    # enorme o lenta se corta a mitad y cuenta solo lo leído
+    step = max(1, len(folders) // VALIDATION_SAMPLE_FOLDERS)
+    sampled = 0
+    sampled_images = 0
+    partial_folders = 0
+    for path in folders[::step][:VALIDATION_SAMPLE_FOLDERS]:
+        if budget <= 0 or time.monotonic() > deadline:
+            break
+        try:
+            images, visited, folder_complete = count_folder_images(
+                path, deadline=deadline, max_entries=budget
+            )
+        except OSError:
+            continue
+        budget -= visited
+        sampled_images += images
+        sampled += 1
+        if not folder_complete:
+            partial_folders += 1
+    
+    image_count = round(sampled_images / sampled * len(folders)) if sampled else 0
+    return {
+        'manga_folders': len(folders),
+        'image_count': image_count,
+        'sampled_folders': sampled,
+        'partial_folders': partial_folders,
+        'complete_listing': complete,
+        'lower_bound': not complete or partial_folders > 0
+    }
+
+def directory_scan_id(directory, mtime_ns):
+    return hashlib.sha256(f'{directory}\0{mtime_ns}'.encode('utf-8')).hexdigest()[:32]
+
+def directory_scan_path(scan_id, suffix='.json'):
+    return os.path.join(VALIDATION_SCAN_DIR, scan_id + suffix)
+
+def is_valid_scan_id(scan_id):
+    return len(scan_id) == 32 and all(c in '0123456789abcdef' for c in scan_id)
+
+def read_directory_scan(scan_id):
+    """Leer el estado de un conteo o None si no existe"""
+    try:
+        with open(directory_scan_path(scan_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_directory_scan(scan):
+    """Publicar el estado de un conteo de forma atómica"""
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=VALIDATION_SCAN_DIR)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(scan, f)
+    os.replace(tmp_path, directory_scan_path(scan['id']))
+
+def is_scan_usable(scan):
+    """Un conteo sirve si terminó bien o sigue en marcha con latido reciente"""
+    if scan is None:
+        return False
+    if scan['state'] == 'done':
+        return True
+    if scan['state'] != 'running':
+        return False
+    try:
+        heartbeat = os.path.getmtime(directory_scan_path(scan['id']))
+    except OSError:
+        return False
+    return time.time() - heartbeat < VALIDATION_SCAN_STALE
+
+def prune_directory_scans():
+    """Descartar los resultados más antiguos
+
+    Los conteos que siguen en marcha no se tocan: su hilo volvería a escribir
+    el estado borrado. Se descartan cuando terminan (o cuando dejan de latir).
+    """
+    states = []
+    for entry in os.scandir(VALIDATION_SCAN_DIR):
+        if entry.name.endswith('.json'):
+            try:
+                states.append((entry.stat().st_mtime, entry.name[:-len('.json')]))
+            except OSError:
+                continue
+    states.sort()
+    excess = len(states) - VALIDATION_CACHE_SIZE
+    for _, scan_id in states:
+        if excess <= 0:
+            break
+        scan = read_directory_scan(scan_id)
+        if scan and scan['state'] == 'running' and is_scan_usable(scan):
+            continue
+        for suffix in ('.json', '.cancel'):
+            try:
+                os.remove(directory_scan_path(scan_id, suffix))
+            except OSError:
+                pass
+        excess -= 1
+
+def get_or_start_directory_scan(directory, mtime_ns):
+    """Devolver el conteo de este directorio o lanzarlo si no hay uno válido"""
+    scan_id = directory_scan_id(directory, mtime_ns)
+    scan = read_directory_scan(scan_id)
+    if is_scan_usable(scan):
+        return scan
+    
+    os.makedirs(VALIDATION_SCAN_DIR, exist_ok=True)
+    lock_path = directory_scan_path(scan_id, '.lock')
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        # Otro worker está lanzando este mismo conteo: esperar a su estimación
+        deadline = time.time() + VALIDATION_TIME_BUDGET * 4
+        while time.time() < deadline:
+            time.sleep(0.05)
+            scan = read_directory_scan(scan_id)
+            if is_scan_usable(scan):
+                return scan
+        # El worker que tenía el lock murió sin publicar nada
+        try:
+            if time.time() - os.path.getmtime(lock_path) > VALIDATION_SCAN_STALE:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        return scan
+    
+    try:
+        # Comprobar de nuevo: otro worker pudo terminar de lanzarlo mientras tanto
+        scan = read_directory_scan(scan_id)
+        if is_scan_usable(scan):
+            return scan
+        return start_directory_scan(scan_id, directory, estimate_directory(directory))
+    finally:
+        os.remove(lock_path)
+
+def start_directory_scan(scan_id, directory, estimate):
+    """Lanzar el conteo completo de un directorio en segundo plano"""
+    scan = {
+        'id': scan_id,
+        'directory': directory,
+        'state': 'running',
+        'estimate': estimate,
+        'manga_folders': 0,
+        'image_count': 0,
+        'skipped_folders': 0,
+        'started_at': time.time(),
+        'finished_at': None,
+        'error': None
+    }
+    
+    try:
+        os.remove(directory_scan_path(scan_id, '.cancel'))
+    except FileNotFoundError:
+        pass
+    write_directory_scan(scan)
+    prune_directory_scans()
+    
+    threading.Thread(target=run_directory_scan, args=(scan,), daemon=True).start()
+    return scan
+
+def run_directory_scan(scan):
+    """Contar todas las carpetas e imágenes publicando el progreso"""
+    cancel = ScanControl(scan['id'])
+    last_write = time.monotonic()
+    try:
+        with os.scandir(scan['directory']) as entries:
+            for entry in entries:
+                if cancel.is_set():
+                    break
+                try:
+                    if not entry.is_dir():
+                        continue
+                    images, _, _ = count_folder_images(entry.path, cancel)
+                except OSError:
+                    scan['skipped_folders'] += 1
+                    continue
+                scan['manga_folders'] += 1
+                scan['image_count'] += images
+                if time.monotonic() - last_write > VALIDATION_SCAN_WRITE_INTERVAL:
+                    write_directory_scan(scan)
+                    last_write = time.monotonic()
+        scan['state'] = 'cancelled' if cancel.is_set() else 'done'
+    except OSError as e:
+        scan['state'] = 'error'
+        scan['error'] = str(e)
+    scan['finished_at'] = time.time()
+    try:
+        write_directory_scan(scan)
+    except OSError as e:
+        print(f"No se pudo guardar el resultado de la validación: {e}")
+    # El marcador de cancelación solo hace falta mientras el conteo sigue vivo
+    try:
+        os.remove(cancel.cancel_path)
+    except OSError:
+        pass
+
+def directory_scan_response(scan):
+    """Construir la respuesta JSON de una validación de directorio"""
+    done = scan['state'] == 'done'
+    source = scan if done else scan['estimate']
+    manga_folders = source['manga_folders']
+    image_count = source['image_count']
+    
+    lower_bound = not done and scan['estimate'].get('lower_bound', False)
+    if done:
+        message = f'Directorio válido con {manga_folders} carpetas de manga y {image_count} imágenes'
+    elif lower_bound:
+        message = f'Directorio válido con al menos {manga_folders} carpetas de manga y {image_count} imágenes (contando...)'
+    else:
+        message = f'Directorio válido con ~{manga_folders} carpetas de manga y ~{image_count} imágenes (estimado)'
+    
+    return {
+        'success': scan['state'] != 'error',
+        'directory': scan['directory'],
+        'manga_folders': manga_folders,
+        'image_count': image_count,
+        'estimated': not done,
+        'lower_bound': lower_bound,
+        'scan_id': scan['id'],
+        'scan_state': scan['state'],
+        'progress': {
+            'manga_folders': scan['manga_folders'],
+            'image_count': scan['image_count'],
+            'skipped_folders': scan['skipped_folders'],
+            'elapsed': round((scan['finished_at'] or time.time()) - scan['started_at'], 2)
+        },
+        'message': message if scan['state'] != 'error' else None,
+        'error': scan['error']
+    }
+
 # Rutas de vistas principales
 @app.route('/')
 @token_required
@@ -161,6 +680,15 @@ def login():
 def register():
     return render_template('register.html')
 
+# El service worker se sirve desde la raíz para que su alcance cubra toda la app
+@app.route('/sw.js')
+def service_worker():
+    response = send_from_directory(
+        os.path.join(app.static_folder, 'js'), 'sw.js', mimetype='application/javascript'
+    )
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/manga/<int:manga_id>')
 @token_required
 def manga_detail(current_user_id, manga_id):
@@ -209,7 +737,7 @@ def api_register():
                 return jsonify({'message': 'El usuario o email ya está registrado'}), 400
             
             # Crear nuevo usuario
-            password_hash = generate_password_hash(password)
+            password_hash = password_hasher.hash(password)
             conn.execute(
                 'INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
                 (username, email, password_hash)
@@ -220,6 +748,8 @@ def api_register():
             'user': {'username': username, 'email': email}
         }), 201
         
+    except HasherBusy:
+        return auth_busy_response()
     except Exception as e:
         print(f"Error en registro: {str(e)}")  # Para debugging
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
@@ -246,13 +776,21 @@ def api_login():
             if not user:
                 return jsonify({'message': 'Usuario no encontrado'}), 401
                 
-            if not check_password_hash(user['password_hash'], password):
+            if not password_hasher.verify(user['password_hash'], password):
                 return jsonify({'message': 'Contraseña incorrecta'}), 401
             
+            # Actualizar el hash al coste actual; si el pool está lleno se hará en otro login
+            password_hash = user['password_hash']
+            if password_hasher.needs_rehash(password_hash):
+                try:
+                    password_hash = password_hasher.hash(password)
+                except HasherBusy:
+                    pass
+            
             # Actualizar último login
             conn.execute(
-                'UPDATE users SET last_login = ? WHERE id = ?',
-                (datetime.now(), user['id'])
+                'UPDATE users SET last_login = ?, password_hash = ? WHERE id = ?',
+                (datetime.now(), password_hash, user['id'])
             )
             
         # Generar token
@@ -269,6 +807,8 @@ def api_login():
         response.set_cookie('token', token, max_age=24*60*60, httponly=True)
         return response
         
+    except HasherBusy:
+        return auth_busy_response()
     except Exception as e:
         print(f"Error en login: {str(e)}")  # Para debugging
         return jsonify({'message': f'Error en el servidor: {str(e)}'}), 500
@@ -344,6 +884,13 @@ def api_manga_detail(current_user_id, manga_id):
         manga_dict['genres'] = manga_dict['genres'].split(',') if manga_dict['genres'] else []
         manga_dict['tags'] = manga_dict['tags'].split(',') if manga_dict['tags'] else []
         
+        with get_db() as conn:
+            favorite = conn.execute(
+                'SELECT 1 FROM favorites WHERE user_id = ? AND manga_id = ?',
+                (current_user_id, manga_id)
+            ).fetchone()
+        manga_dict['is_favorite'] = favorite is not None
+        
         return jsonify(manga_dict)
         
     except Exception as e:
@@ -353,6 +900,18 @@ def api_manga_detail(current_user_id, manga_id):
 @api_token_required
 def api_manga_view(current_user_id, manga_id):
     try:
+        if is_replica():
+            # Las vistas se acumulan y se envían al primario en lotes
+            view_writer.add(manga_id, (1, datetime.now()))
+            with get_db() as conn:
+                manga = conn.execute(
+                    'SELECT * FROM mangas WHERE id = ?',
+                    (manga_id,)
+                ).fetchone()
+            if not manga:
+                return jsonify({'error': 'Manga no encontrado'}), 404
+            return jsonify(dict(manga))
+        
         with get_db() as conn:
             # Incrementar vistas
             conn.execute(
@@ -375,9 +934,38 @@ def api_manga_view(current_user_id, manga_id):
     except Exception as e:
         return jsonify({'error': 'Error al actualizar vistas'}), 500
 
-@app.route('/api/mangas/<int:manga_id>/images')
-@api_token_required
-def api_manga_images(current_user_id, manga_id):
+def find_manga_folder(manga_id_clean):
+    """Buscar la carpeta real de un manga a partir de su manga_id"""
+    manga_base_directory = get_manga_directory()
+    
+    # Un manga_id es un único nombre de carpeta: nada de '..' ni separadores
+    separators = [sep for sep in (os.sep, os.altsep) if sep]
+    if manga_id_clean in ('', '.', '..') or any(sep in manga_id_clean for sep in separators):
+        return None
+    
+    # Primero intentar con el manga_id directo (sin salir del directorio de mangas,
+    # tampoco a través de enlaces simbólicos)
+    test_folder = os.path.join(manga_base_directory, manga_id_clean)
+    if os.path.isdir(test_folder):
+        base_real = os.path.realpath(manga_base_directory)
+        folder_real = os.path.realpath(test_folder)
+        if folder_real != base_real and os.path.commonpath([base_real, folder_real]) == base_real:
+            return test_folder
+        return None
+    
+    # Buscar por nombre de carpeta original
+    if os.path.exists(manga_base_directory):
+        for folder_name in os.listdir(manga_base_directory):
+            folder_path = os.path.join(manga_base_directory, folder_name)
+            if os.path.isdir(folder_path):
+                # Convertir nombre de carpeta a manga_id para comparar
+                folder_manga_id = folder_name.lower().replace(' ', '-').replace('/', '-')
+                if folder_manga_id == manga_id_clean:
+                    return folder_path
+    return None
+
+def list_manga_images(manga_id):
+    """Manifiesto de páginas de un manga; devuelve (datos, código HTTP)"""
     try:
         with get_db() as conn:
             manga = conn.execute(
@@ -386,31 +974,22 @@ def api_manga_images(current_user_id, manga_id):
             ).fetchone()
             
         if not manga:
-            return jsonify({'error': 'Manga no encontrado'}), 404
+            return {'error': 'Manga no encontrado'}, 404
         
-        # Buscar la carpeta real del manga
-        manga_folder = None
         manga_id_clean = manga['manga_id']
-        manga_base_directory = get_manga_directory()
+        manga_folder = find_manga_folder(manga_id_clean)
+        if not manga_folder:
+            return {'error': 'Directorio del manga no encontrado'}, 404
         
-        # Primero intentar con el manga_id directo
-        test_folder = os.path.join(manga_base_directory, manga_id_clean)
-        if os.path.exists(test_folder):
-            manga_folder = test_folder
-        else:
-            # Buscar por nombre de carpeta original
-            if os.path.exists(manga_base_directory):
-                for folder_name in os.listdir(manga_base_directory):
-                    folder_path = os.path.join(manga_base_directory, folder_name)
-                    if os.path.isdir(folder_path):
-                        # Convertir nombre de carpeta a manga_id para comparar
-                        folder_manga_id = folder_name.lower().replace(' ', '-').replace('/', '-')
-                        if folder_manga_id == manga_id_clean:
-                            manga_folder = folder_path
-                            break
-        
-        if not manga_folder or not os.path.exists(manga_folder):
-            return jsonify({'error': 'Directorio del manga no encontrado'}), 404
+        # Índice de páginas deduplicadas (si la importación calculó hashes)
+        with get_db() as conn:
+            page_hashes = {
+                row['filename']: row['content_hash'] for row in conn.execute('''
+                    SELECT p.filename, b.content_hash FROM pages p
+                    JOIN blobs b ON b.id = p.blob_id
+                    WHERE p.manga_id = ?
+                ''', (manga_id_clean,))
+            }
         
         # Obtener lista de imágenes
         images = []
@@ -419,12 +998,16 @@ def api_manga_images(current_user_id, manga_id):
         try:
             for filename in os.listdir(manga_folder):
                 if any(filename.lower().endswith(ext) for ext in allowed_extensions):
+                    if filename in page_hashes:
+                        url = f'/page/{page_hashes[filename]}'
+                    else:
+                        url = f'/manga/{manga_id_clean}/{filename}'
                     images.append({
                         'filename': filename,
-                        'url': f'/manga/{manga_id_clean}/{filename}'
+                        'url': url
                     })
         except PermissionError:
-            return jsonify({'error': 'Sin permisos para leer el directorio'}), 403
+            return {'error': 'Sin permisos para leer el directorio'}, 403
         
         # Ordenar imágenes naturalmente
         def natural_sort_key(item):
@@ -433,36 +1016,253 @@ def api_manga_images(current_user_id, manga_id):
         
         images.sort(key=natural_sort_key)
         
-        return jsonify({
+        return {
             'images': images,
             'totalPages': len(images)
-        })
+        }, 200
         
     except Exception as e:
         print(f"Error en api_manga_images: {str(e)}")
-        return jsonify({'error': f'Error al obtener imágenes: {str(e)}'}), 500
+        return {'error': f'Error al obtener imágenes: {str(e)}'}, 500
+
+@app.route('/api/mangas/<int:manga_id>/images')
+@api_token_required
+def api_manga_images(current_user_id, manga_id):
+    data, status = list_manga_images(manga_id)
+    return jsonify(data), status
+
+# API Routes - Progreso de lectura
+@app.route('/api/progress', methods=['POST'])
+@api_token_required
+def api_save_progress(current_user_id):
+    """Guardar posiciones de lectura (una o un lote)
+
+    En el primario se escriben al momento: cada worker tiene su propio búfer y
+    una lectura servida por otro worker no vería lo pendiente. En una réplica se
+    acumulan y se envían al primario en lotes.
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({'error': 'No se recibieron datos'}), 400
+    
+    updates = data.get('updates', [data]) if isinstance(data, dict) else data
+    if not isinstance(updates, list):
+        return jsonify({'error': 'Formato de progreso inválido'}), 400
+    
+    now = datetime.now()
+    batch = {}
+    for update in updates:
+        try:
+            manga_id = int(update['manga_id'])
+            page = int(update['page'])
+            total_pages = int(update['total_pages']) if update.get('total_pages') is not None else None
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Formato de progreso inválido'}), 400
+        if page < 1:
+            return jsonify({'error': 'La página debe ser mayor que 0'}), 400
+        batch[(current_user_id, manga_id)] = (page, total_pages, now)
+    
+    if is_replica():
+        for key, value in batch.items():
+            progress_writer.add(key, value)
+    else:
+        try:
+            write_progress_batch(batch)
+        except sqlite3.Error:
+            return jsonify({'error': 'Error al guardar el progreso'}), 500
+    
+    return jsonify({'success': True, 'queued': len(updates)}), 202
+
+@app.route('/api/progress/<int:manga_id>')
+@api_token_required
+def api_get_progress(current_user_id, manga_id):
+    """Obtener la posición de lectura de un manga"""
+    try:
+        with get_db() as conn:
+            progress = conn.execute(
+                'SELECT manga_id, page, total_pages, updated_at FROM reading_progress '
+                'WHERE user_id = ? AND manga_id = ?',
+                (current_user_id, manga_id)
+            ).fetchone()
+        
+        return jsonify({'progress': dict(progress) if progress else None})
+        
+    except Exception as e:
+        return jsonify({'error': 'Error al cargar el progreso'}), 500
+
+@app.route('/api/progress/continue')
+@api_token_required
+def api_continue_reading(current_user_id):
+    """Estantería "continuar leyendo": últimos mangas leídos por el usuario"""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        with get_db() as conn:
+            mangas = conn.execute('''
+                SELECT m.*, p.page AS progress_page, p.total_pages AS progress_total_pages,
+                       p.updated_at AS progress_updated_at
+                FROM reading_progress p
+                JOIN mangas m ON m.id = p.manga_id
+                WHERE p.user_id = ? AND m.status = 'activo'
+                ORDER BY p.updated_at DESC
+                LIMIT ?
+            ''', (current_user_id, limit)).fetchall()
+        
+        return jsonify([dict(manga) for manga in mangas])
+        
+    except Exception as e:
+        return jsonify({'error': 'Error al cargar el progreso'}), 500
+
+# API Routes - Favoritos
+@app.route('/api/favorites')
+@api_token_required
+def api_favorites(current_user_id):
+    """Listar los mangas favoritos del usuario, los más recientes primero"""
+    try:
+        with get_db() as conn:
+            mangas = conn.execute('''
+                SELECT m.*, f.created_at AS favorited_at
+                FROM favorites f
+                JOIN mangas m ON m.id = f.manga_id
+                WHERE f.user_id = ? AND m.status = 'activo'
+                ORDER BY f.created_at DESC
+            ''', (current_user_id,)).fetchall()
+        
+        return jsonify([dict(manga) for manga in mangas])
+        
+    except Exception as e:
+        return jsonify({'error': 'Error al cargar favoritos'}), 500
+
+@app.route('/api/favorites/<int:manga_id>', methods=['PUT'])
+@api_token_required
+def api_add_favorite(current_user_id, manga_id):
+    try:
+        with get_db() as conn:
+            if not conn.execute('SELECT 1 FROM mangas WHERE id = ?', (manga_id,)).fetchone():
+                return jsonify({'error': 'Manga no encontrado'}), 404
+            conn.execute(
+                'INSERT OR IGNORE INTO favorites (user_id, manga_id, created_at) VALUES (?, ?, ?)',
+                (current_user_id, manga_id, datetime.now())
+            )
+        
+        return jsonify({'success': True, 'is_favorite': True})
+        
+    except Exception as e:
+        return jsonify({'error': 'Error al guardar favorito'}), 500
+
+@app.route('/api/favorites/<int:manga_id>', methods=['DELETE'])
+@api_token_required
+def api_remove_favorite(current_user_id, manga_id):
+    try:
+        with get_db() as conn:
+            conn.execute(
+                'DELETE FROM favorites WHERE user_id = ? AND manga_id = ?',
+                (current_user_id, manga_id)
+            )
+        
+        return jsonify({'success': True, 'is_favorite': False})
+        
+    except Exception as e:
+        return jsonify({'error': 'Error al eliminar favorito'}), 500
+
+def page_response(data, content_type, mtime, etag=None, max_age=None):
+    """Construir la respuesta de una página servida desde memoria"""
+    response = Response(data, mimetype=content_type)
+    response.last_modified = mtime
+    if etag:
+        response.set_etag(etag)
+    if max_age:
+        response.headers['Cache-Control'] = f'private, max-age={max_age}, immutable'
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def send_page_file(folder, filename, cache_key, etag=None, max_age=None):
+    """Servir una página desde disco y guardarla en la caché compartida si cabe"""
+    path = safe_join(folder, filename)
+    if path is None or not os.path.isfile(path):
+        return "Archivo no encontrado", 404
+    
+    stat = os.stat(path)
+    if page_cache is None or stat.st_size > page_cache.max_item_bytes:
+        return send_from_directory(folder, filename, etag=etag or True, max_age=max_age)
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    page_cache.put(cache_key, data, content_type, stat.st_mtime)
+    return page_response(data, content_type, stat.st_mtime, etag, max_age)
 
 # Servir archivos de manga
 @app.route('/manga/<manga_id>/<filename>')
 @token_required
 def serve_manga_file(current_user_id, manga_id, filename):
-    # Usar la ruta configurada dinámicamente
-    manga_base_directory = get_manga_directory()
-    manga_folder = os.path.join(manga_base_directory, manga_id)
-    if os.path.exists(manga_folder):
-        return send_from_directory(manga_folder, filename)
-    else:
-        # Fallback: buscar por nombre de carpeta original
-        if os.path.exists(manga_base_directory):
-            for folder_name in os.listdir(manga_base_directory):
-                folder_path = os.path.join(manga_base_directory, folder_name)
-                if os.path.isdir(folder_path):
-                    # Convertir nombre de carpeta a manga_id
-                    folder_manga_id = folder_name.lower().replace(' ', '-').replace('/', '-')
-                    if folder_manga_id == manga_id:
-                        return send_from_directory(folder_path, filename)
-        
+    # Páginas calientes: responder desde memoria sin tocar el disco
+    cache_key = f'/manga/{manga_id}/{filename}'
+    cached = page_cache.get(cache_key) if page_cache else None
+    if cached:
+        return page_response(*cached)
+    
+    # Usar la ruta configurada dinámicamente (o la carpeta con el nombre original)
+    manga_folder = find_manga_folder(manga_id)
+    if manga_folder:
+        return send_page_file(manga_folder, filename, cache_key)
+    return "Archivo no encontrado", 404
+
+def find_blob_path(content_hash):
+    """Ruta en disco de una página deduplicada o None
+
+    /page/<hash> se sirve como inmutable, así que solo vale si el archivo sigue
+    teniendo el tamaño y el mtime de cuando se calculó el hash: si se editó o
+    reemplazó después de importar, sus bytes ya no corresponden a ese hash.
+    """
+    with get_db() as conn:
+        blob = conn.execute(
+            'SELECT path, size, mtime FROM blobs WHERE content_hash = ?',
+            (content_hash,)
+        ).fetchone()
+    if not blob:
+        return None
+    try:
+        stat = os.stat(blob['path'])
+    except OSError:
+        return None
+    if stat.st_size != blob['size'] or stat.st_mtime != blob['mtime']:
+        return None
+    return blob['path']
+
+def blob_fallback_url(content_hash):
+    """URL por nombre de una página deduplicada, para cuando su blob ya no es válido"""
+    with get_db() as conn:
+        page = conn.execute('''
+            SELECT p.manga_id, p.filename FROM pages p
+            JOIN blobs b ON b.id = p.blob_id
+            WHERE b.content_hash = ?
+            LIMIT 1
+        ''', (content_hash,)).fetchone()
+    return f"/manga/{page['manga_id']}/{page['filename']}" if page else None
+
+# Servir páginas por hash de contenido (compartidas entre mangas)
+@app.route('/page/<content_hash>')
+@token_required
+def serve_page_blob(current_user_id, content_hash):
+    cache_key = f'/page/{content_hash}'
+    cached = page_cache.get(cache_key) if page_cache else None
+    if cached:
+        return page_response(*cached, etag=content_hash, max_age=PAGE_BLOB_MAX_AGE)
+    
+    blob_path = find_blob_path(content_hash)
+    if not blob_path:
+        # El archivo cambió desde la importación: servirlo por su nombre, sin caché inmutable
+        fallback_url = blob_fallback_url(content_hash)
+        if fallback_url:
+            return redirect(fallback_url)
         return "Archivo no encontrado", 404
+    
+    # El contenido nunca cambia para un mismo hash: caché inmutable en el navegador
+    return send_page_file(
+        os.path.dirname(blob_path), os.path.basename(blob_path), cache_key,
+        etag=content_hash, max_age=PAGE_BLOB_MAX_AGE
+    )
 
 @app.route('/api/refresh-library', methods=['POST'])
 @api_token_required
@@ -472,14 +1272,18 @@ def refresh_library(current_user_id):
         import subprocess
         import sys
         
-        # Ejecutar el script de importación en el mismo directorio
+        # Ejecutar el script de importación junto a la base de datos
         script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_mangas.py')
         
         result = subprocess.run([
             sys.executable, script_path
-        ], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        ], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(app.config['DATABASE'])))
         
         if result.returncode == 0:
+            # Las rutas pueden apuntar a otros archivos tras reimportar
+            if page_cache:
+                page_cache.clear()
+            
             # Contar cuántos mangas hay ahora en la base de datos
             with get_db() as conn:
                 count = conn.execute('SELECT COUNT(*) as total FROM mangas').fetchone()['total']
@@ -503,6 +1307,14 @@ def refresh_library(current_user_id):
             'error': f'Error interno: {str(e)}'
         }), 500
 
+@app.route('/api/cache/stats')
+@api_token_required
+def api_cache_stats(current_user_id):
+    """Estadísticas de la caché de páginas calientes"""
+    if not page_cache:
+        return jsonify({'success': True, 'enabled': False})
+    return jsonify({'success': True, 'enabled': True, 'stats': page_cache.stats()})
+
 # API Routes - Configuración
 @app.route('/api/settings', methods=['GET'])
 @api_token_required
@@ -569,6 +1381,8 @@ def api_update_settings(current_user_id):
                 
             # Actualizar la configuración de la aplicación
             app.config['UPLOAD_FOLDER'] = manga_dir
+            if page_cache:
+                page_cache.clear()
         
         # Guardar todas las configuraciones
         updated_settings = []
@@ -632,33 +1446,15 @@ def api_validate_directory(current_user_id):
                 'error': 'Sin permisos de lectura'
             })
             
-        # Contar archivos de imagen en el directorio
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        image_count = 0
-        manga_folders = 0
+        # Resultado exacto en caché para esta ruta y mtime (compartido entre workers)
+        scan = get_or_start_directory_scan(directory, os.stat(directory).st_mtime_ns)
+        if scan is None:
+            return jsonify({
+                'success': False,
+                'error': 'La validación de este directorio se está iniciando, inténtalo de nuevo'
+            }), 503
         
-        try:
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                if os.path.isdir(item_path):
-                    manga_folders += 1
-                    # Contar imágenes en subdirectorios
-                    try:
-                        for file in os.listdir(item_path):
-                            if os.path.splitext(file.lower())[1] in image_extensions:
-                                image_count += 1
-                    except:
-                        pass
-        except:
-            pass
-            
-        return jsonify({
-            'success': True,
-            'directory': directory,
-            'manga_folders': manga_folders,
-            'image_count': image_count,
-            'message': f'Directorio válido con {manga_folders} carpetas de manga y {image_count} imágenes'
-        })
+        return jsonify(directory_scan_response(scan))
         
     except Exception as e:
         return jsonify({
@@ -666,7 +1462,125 @@ def api_validate_directory(current_user_id):
             'error': f'Error al validar directorio: {str(e)}'
         }), 500
 
+@app.route('/api/settings/validate-directory/<scan_id>', methods=['GET'])
+@api_token_required
+def api_validate_directory_progress(current_user_id, scan_id):
+    """Consultar el progreso del conteo completo de un directorio"""
+    scan = read_directory_scan(scan_id) if is_valid_scan_id(scan_id) else None
+    if not scan:
+        return jsonify({'success': False, 'error': 'Validación no encontrada'}), 404
+    if scan['state'] == 'running' and not is_scan_usable(scan):
+        scan['state'] = 'error'
+        scan['error'] = 'El conteo se interrumpió; vuelve a validar el directorio'
+    return jsonify(directory_scan_response(scan))
+
+@app.route('/api/settings/validate-directory/<scan_id>', methods=['DELETE'])
+@api_token_required
+def api_validate_directory_cancel(current_user_id, scan_id):
+    """Cancelar el conteo completo de un directorio"""
+    scan = read_directory_scan(scan_id) if is_valid_scan_id(scan_id) else None
+    if not scan:
+        return jsonify({'success': False, 'error': 'Validación no encontrada'}), 404
+    # El worker que cuenta ve el marcador en su siguiente comprobación
+    open(directory_scan_path(scan_id, '.cancel'), 'a').close()
+    return jsonify(directory_scan_response(scan))
+
+# Replicación
+# Endpoints que en una réplica se atienden en el primario: escrituras y estado
+# por usuario que debe leerse actualizado (el detalle incluye is_favorite y el
+# usuario puede haberse registrado después de la última instantánea)
+REPLICA_FORWARDED_ENDPOINTS = {
+    'api_register', 'api_login', 'refresh_library', 'api_update_settings',
+    'api_add_favorite', 'api_remove_favorite', 'api_favorites',
+    'api_get_progress', 'api_continue_reading',
+    'api_manga_detail', 'api_user_info'
+}
+
+@app.before_request
+def forward_to_primary():
+    """En una réplica, reenviar al primario las peticiones que escriben"""
+    if not is_replica() or request.endpoint not in REPLICA_FORWARDED_ENDPOINTS:
+        return None
+    
+    if request.endpoint in ('api_get_progress', 'api_continue_reading'):
+        # Enviar antes el progreso acumulado en este worker
+        try:
+            progress_writer.flush()
+        except PrimaryUnavailable:
+            pass
+    
+    try:
+        status, headers, body = forward_request(app.config['PRIMARY_URL'], request)
+    except PrimaryUnavailable:
+        return jsonify({'error': 'Nodo primario no disponible, inténtalo más tarde'}), 503
+    return Response(body, status=status, headers=headers)
+
+@app.route('/api/replication/snapshot')
+@replication_token_required
+def api_replication_snapshot():
+    """Instantánea consistente de la base de datos para los nodos réplica"""
+    version = database_version(app.config['DATABASE'])
+    if version in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{version}"'})
+    
+    snapshot_path = create_snapshot(
+        app.config['DATABASE'],
+        directory=os.path.dirname(os.path.abspath(app.config['DATABASE']))
+    )
+    # Desvincular el archivo ya abierto: se libera al terminar la descarga
+    snapshot = open(snapshot_path, 'rb')
+    os.remove(snapshot_path)
+    return send_file(snapshot, mimetype='application/vnd.sqlite3', etag=version, conditional=False)
+
+@app.route('/api/replication/writes', methods=['POST'])
+@replication_token_required
+def api_replication_writes():
+    """Aplicar escrituras acumuladas por los nodos réplica"""
+    data = request.get_json(silent=True) or {}
+    try:
+        progress = {
+            (int(user_id), int(manga_id)): (int(page), total_pages, updated_at)
+            for user_id, manga_id, page, total_pages, updated_at in data.get('progress', [])
+        }
+        views = {
+            int(manga_id): (int(count), last_viewed)
+            for count, last_viewed, manga_id in data.get('views', [])
+        }
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Formato de escrituras inválido'}), 400
+    
+    if progress:
+        write_progress_batch(progress)
+    if views:
+        write_views_batch(views)
+    return jsonify({'success': True, 'progress': len(progress), 'views': len(views)})
+
+@app.route('/api/replication/status')
+@api_token_required
+def api_replication_status(current_user_id):
+    """Rol del nodo y estado de la instantánea"""
+    status = {'role': app.config['ROLE']}
+    if is_replica():
+        status['snapshot'] = snapshot_sync.status()
+        status['pending_writes'] = progress_writer.pending_count() + view_writer.pending_count()
+    else:
+        status['version'] = database_version(app.config['DATABASE'])
+    return jsonify(status)
+
+def create_app():
+    """Preparar la aplicación una sola vez antes de crear los workers"""
+    if is_replica():
+        # La réplica no escribe: esperar la primera instantánea y renovarla en segundo plano
+        if not snapshot_sync.wait_for_first():
+            raise RuntimeError(f"No se pudo obtener la instantánea de {app.config['PRIMARY_URL']}")
+        snapshot_sync.start()
+    else:
+        init_db()
+        init_default_settings()
+    app.config['UPLOAD_FOLDER'] = get_manga_directory()
+    mimetypes.init()
+    return app
+
 if __name__ == '__main__':
-    init_db()
-    init_default_settings()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Servidor de desarrollo; en producción usar gunicorn (ver gunicorn.conf.py)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,420 @@
+"""
+Servidor ASGI para servir páginas a muchos clientes lentos
+
+Con el servidor WSGI cada descarga de una página ocupa un hilo durante toda la
+transferencia, así que unos cientos de lectores con conexiones móviles lentas
+agotan los hilos mucho antes que la CPU o el disco. Aquí las rutas de páginas
+(/manga/<id>/<archivo>, /page/<hash>) y el manifiesto de imágenes
+(/api/mangas/<id>/images) se atienden en un bucle de eventos:
+
+- las lecturas de disco y las consultas a SQLite se delegan a un pool de hilos
+  acotado, de modo que el bucle nunca se bloquea;
+- toda página se envía por bloques y cada bloque espera a que el cliente haya
+  consumido el anterior (el servidor pausa send() cuando su búfer de escritura
+  se llena), con un límite de tiempo por bloque; cada bloque se copia de la
+  caché compartida o se lee del disco justo antes de enviarlo, así cada
+  conexión lenta retiene como mucho un bloque en memoria;
+- el resto de rutas se delegan a la aplicación Flask a través de un adaptador
+  WSGI, con la misma autenticación y la misma resolución de carpetas.
+
+Uso:
+    uvicorn asgi:create_asgi_app --factory --port 5000
+    LECTORM_ASYNC=1 gunicorn --config gunicorn.conf.py "asgi:create_asgi_app()"
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import re
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from werkzeug.http import parse_cookie
+from werkzeug.security import safe_join
+
+import app as flask_app_module
+from app import (
+    PAGE_BLOB_MAX_AGE, blob_fallback_url, create_app, decode_user_token,
+    find_blob_path, find_manga_folder, list_manga_images
+)
+
+# Tamaño de cada bloque enviado: cuánto retiene en memoria una conexión lenta
+STREAM_CHUNK_SIZE = int(os.environ.get('LECTORM_ASYNC_CHUNK_KB', '64')) * 1024
+# Hilos para lecturas de disco y consultas; limita la presión sobre el disco
+BLOCKING_THREADS = int(os.environ.get('LECTORM_ASYNC_THREADS', '32'))
+# Hilos para las rutas servidas por Flask
+WSGI_THREADS = int(os.environ.get('LECTORM_WSGI_THREADS', '16'))
+# Segundos que puede tardar un cliente en aceptar un bloque antes de cortarlo
+SEND_TIMEOUT = float(os.environ.get('LECTORM_ASYNC_SEND_TIMEOUT', '60'))
+
+MANGA_FILE_ROUTE = re.compile(r'^/manga/([^/]+)/([^/]+)$')
+PAGE_BLOB_ROUTE = re.compile(r'^/page/([^/]+)$')
+MANGA_IMAGES_ROUTE = re.compile(r'^/api/mangas/(\d+)/images$')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Un pool por worker: los hilos no sobreviven al fork
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=BLOCKING_THREADS, thread_name_prefix='lectorm-io'
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+async def run_blocking(func, *args):
+    """Ejecutar una llamada bloqueante en el pool sin detener el bucle de eventos"""
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+
+
+def request_headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def request_user(headers, allow_header_token=False):
+    """user_id de la cookie (o de x-access-token en la API); None si falta o no es válido"""
+    token = parse_cookie(headers.get('cookie', '')).get('token')
+    if not token and allow_header_token:
+        token = headers.get('x-access-token')
+    if not token:
+        return None, False
+    return decode_user_token(token), True
+
+
+async def send_simple(send, status, body=b'', content_type='text/html; charset=utf-8', extra_headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            *extra_headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, data, status=200):
+    await send_simple(send, status, json.dumps(data).encode('utf-8'), 'application/json')
+
+
+async def redirect(send, location):
+    await send_simple(send, 302, extra_headers=[(b'location', location.encode('latin-1'))])
+
+
+async def redirect_to_login(send):
+    await redirect(send, '/login')
+
+
+async def not_found(send):
+    await send_simple(send, 404, 'Archivo no encontrado'.encode('utf-8'))
+
+
+def page_headers(content_type, mtime, etag=None, max_age=None):
+    """Cabeceras de una página, equivalentes a las del servidor Flask"""
+    headers = [
+        (b'content-type', content_type.encode('latin-1')),
+        (b'last-modified', formatdate(int(mtime), usegmt=True).encode('latin-1'))
+    ]
+    if etag:
+        headers.append((b'etag', f'"{etag}"'.encode('latin-1')))
+    if max_age:
+        headers.append((b'cache-control', f'private, max-age={max_age}, immutable'.encode('latin-1')))
+    else:
+        headers.append((b'cache-control', b'no-cache'))
+    return headers
+
+
+def is_not_modified(headers, mtime, etag=None):
+    """Comprobar If-None-Match / If-Modified-Since como make_conditional de Flask"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        if not etag:
+            return False
+        candidates = [value.strip().removeprefix('W/').strip('"') for value in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates
+
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def watch_disconnect(receive, disconnected):
+    # El cuerpo de un GET ya se consumió; el siguiente mensaje es la desconexión
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+def open_page(path):
+    """Abrir una página y devolver (archivo, stat) o None si no es un archivo"""
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return None
+    info = os.fstat(f.fileno())
+    if not stat.S_ISREG(info.st_mode):
+        f.close()
+        return None
+    return f, info
+
+
+async def file_chunks(f, size):
+    """Leer un archivo abierto por bloques, cada lectura fuera del bucle"""
+    remaining = size
+    while remaining > 0:
+        chunk = await run_blocking(f.read, min(STREAM_CHUNK_SIZE, remaining))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def cache_chunks(page_cache, cache_key, size, mtime, resolve_path):
+    """Copiar una página de la caché bloque a bloque, sin retenerla entera
+
+    Si la entrada se expulsa (o cambia) a mitad de la descarga, se sigue
+    leyendo desde disco en el mismo punto siempre que el archivo no haya cambiado.
+    """
+    position = 0
+    while position < size:
+        chunk = await run_blocking(page_cache.read, cache_key, position, STREAM_CHUNK_SIZE, mtime)
+        if not chunk:
+            break
+        position += len(chunk)
+        yield chunk
+    if position >= size:
+        return
+
+    path = await run_blocking(resolve_path)
+    opened = await run_blocking(open_page, path) if path else None
+    if opened is None:
+        return
+    f, info = opened
+    try:
+        if info.st_size != size or info.st_mtime != mtime:
+            return
+        await run_blocking(f.seek, position)
+        async for chunk in file_chunks(f, size - position):
+            yield chunk
+    finally:
+        await run_blocking(f.close)
+
+
+def cache_page_file(page_cache, cache_key, path, content_type):
+    """Leer una página pequeña y guardarla en la caché compartida (en el pool)"""
+    opened = open_page(path)
+    if opened is None:
+        return
+    f, info = opened
+    with f:
+        if info.st_size > page_cache.max_item_bytes:
+            return
+        try:
+            data = f.read()
+        except OSError:
+            return
+    page_cache.put(cache_key, data, content_type, info.st_mtime)
+
+
+_cache_fills = {}
+
+
+def schedule_cache_fill(page_cache, cache_key, path, content_type):
+    """Llenar la caché en segundo plano, una sola lectura por página a la vez
+
+    La descarga en curso no espera ni comparte este búfer: sigue leyendo el
+    disco por bloques, así ninguna conexión lenta retiene la página entera.
+    """
+    if cache_key in _cache_fills:
+        return
+    task = asyncio.ensure_future(run_blocking(cache_page_file, page_cache, cache_key, path, content_type))
+    _cache_fills[cache_key] = task
+    task.add_done_callback(lambda _: _cache_fills.pop(cache_key, None))
+
+
+async def send_page(scope, receive, send, headers, size, chunks):
+    """Enviar una página por bloques, con contrapresión y corte si el cliente se va"""
+    headers = headers + [(b'content-length', str(size).encode('latin-1'))]
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    if scope['method'] == 'HEAD' or size == 0:
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(watch_disconnect(receive, disconnected))
+    try:
+        sent = 0
+        async for chunk in chunks:
+            if disconnected.is_set():
+                break
+            sent += len(chunk)
+            # send() no vuelve hasta que el búfer del socket tiene sitio: un
+            # cliente lento frena su propia descarga sin acumular datos aquí
+            await asyncio.wait_for(
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': sent < size}),
+                SEND_TIMEOUT
+            )
+    except asyncio.TimeoutError:
+        # Cliente detenido: dejar la respuesta a medias y el servidor cierra la conexión
+        pass
+    finally:
+        watcher.cancel()
+        await chunks.aclose()
+
+
+async def send_not_modified(send, headers):
+    await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def serve_page(scope, receive, send, cache_key, resolve_path, etag=None, max_age=None,
+                     on_missing=not_found):
+    """Servir una página desde la caché compartida o desde disco, siempre por bloques
+
+    resolve_path es una función bloqueante que devuelve la ruta del archivo
+    (o None); se llama, fuera del bucle, si la página no está en caché o si
+    sale de ella a mitad de la descarga.
+    """
+    headers = request_headers(scope)
+    page_cache = flask_app_module.page_cache
+
+    # Solo se consultan los metadatos bajo un lock breve: se hace en el bucle
+    # sin esperar (timeout=0); si otro proceso tiene el lock, cuenta como fallo
+    cached = page_cache.lookup(cache_key, timeout=0) if page_cache else None
+    if cached:
+        size, content_type, mtime = cached
+        response_headers = page_headers(content_type, mtime, etag, max_age)
+        if is_not_modified(headers, mtime, etag):
+            await send_not_modified(send, response_headers)
+        else:
+            await send_page(scope, receive, send, response_headers, size,
+                            cache_chunks(page_cache, cache_key, size, mtime, resolve_path))
+        return
+
+    path = await run_blocking(resolve_path)
+    opened = await run_blocking(open_page, path) if path else None
+    if opened is None:
+        await on_missing(send)
+        return
+
+    f, info = opened
+    try:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response_headers = page_headers(content_type, info.st_mtime, etag, max_age)
+        if is_not_modified(headers, info.st_mtime, etag):
+            await send_not_modified(send, response_headers)
+            return
+
+        if page_cache is not None and info.st_size <= page_cache.max_item_bytes:
+            schedule_cache_fill(page_cache, cache_key, path, content_type)
+
+        await send_page(scope, receive, send, response_headers, info.st_size, file_chunks(f, info.st_size))
+    finally:
+        await run_blocking(f.close)
+
+
+async def serve_manga_file(scope, receive, send, manga_id, filename):
+    def resolve_path():
+        manga_folder = find_manga_folder(manga_id)
+        return safe_join(manga_folder, filename) if manga_folder else None
+
+    await serve_page(scope, receive, send, f'/manga/{manga_id}/{filename}', resolve_path)
+
+
+async def serve_page_blob(scope, receive, send, content_hash):
+    async def blob_missing(send):
+        # El archivo cambió desde la importación: servirlo por su nombre, sin caché inmutable
+        fallback_url = await run_blocking(blob_fallback_url, content_hash)
+        if fallback_url:
+            await redirect(send, fallback_url)
+        else:
+            await not_found(send)
+
+    # El contenido nunca cambia para un mismo hash: caché inmutable en el navegador
+    await serve_page(scope, receive, send, f'/page/{content_hash}',
+                     lambda: find_blob_path(content_hash),
+                     etag=content_hash, max_age=PAGE_BLOB_MAX_AGE, on_missing=blob_missing)
+
+
+async def serve_manga_images(scope, send, manga_id):
+    data, status = await run_blocking(list_manga_images, manga_id)
+    await send_json(send, data, status)
+
+
+class LectormASGI:
+    """Rutas de páginas en el bucle de eventos; el resto, a Flask"""
+
+    def __init__(self, flask_app):
+        self.wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            path = scope['path']
+
+            match = MANGA_FILE_ROUTE.match(path)
+            if match:
+                user_id, _ = request_user(request_headers(scope))
+                if user_id is None:
+                    await redirect_to_login(send)
+                    return
+                await serve_manga_file(scope, receive, send, *match.groups())
+                return
+
+            match = PAGE_BLOB_ROUTE.match(path)
+            if match:
+                user_id, _ = request_user(request_headers(scope))
+                if user_id is None:
+                    await redirect_to_login(send)
+                    return
+                await serve_page_blob(scope, receive, send, match.group(1))
+                return
+
+            match = MANGA_IMAGES_ROUTE.match(path)
+            if match:
+                user_id, has_token = request_user(request_headers(scope), allow_header_token=True)
+                if not has_token:
+                    await send_json(send, {'message': 'No token provided'}, 403)
+                    return
+                if user_id is None:
+                    await send_json(send, {'message': 'Unauthorized'}, 401)
+                    return
+                await serve_manga_images(scope, send, int(match.group(1)))
+                return
+
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app():
+    """Inicializar la aplicación Flask y envolverla para servir por ASGI"""
+    return LectormASGI(create_app())
+
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la caché de páginas calientes con un patrón de acceso Zipf
+
+Simula lecturas de páginas con popularidad sesgada (pocos capítulos nuevos muy
+leídos y una cola larga) y compara la tasa de aciertos con y sin admisión
+TinyLFU para varios tamaños de caché. Con --workers reparte la carga entre
+varios procesos que comparten la misma arena, como los workers del servidor.
+
+Uso:
+    python benchmarks/bench_page_cache.py --pages 20000 --requests 200000
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from page_cache import SharedPageCache
+
+
+def zipf_requests(pages, count, skew, seed):
+    """Generar una secuencia de índices de página con distribución Zipf"""
+    rng = random.Random(seed)
+    weights = [1 / (rank ** skew) for rank in range(1, pages + 1)]
+    cumulative = list(itertools.accumulate(weights))
+    order = list(range(pages))
+    rng.shuffle(order)
+    return [order[i] for i in rng.choices(range(pages), cum_weights=cumulative, k=count)]
+
+
+def page_sizes(pages, mean_kb, seed):
+    rng = random.Random(seed)
+    return [max(1024, int(rng.expovariate(1 / (mean_kb * 1024)))) for _ in range(pages)]
+
+
+def run_workload(cache, requests, sizes, payloads):
+    for page in requests:
+        name = f'/manga/bench/{page}.jpg'
+        if cache.get(name) is None:
+            cache.put(name, payloads[sizes[page] % len(payloads)][:sizes[page]], 'image/jpeg')
+
+
+def run(cache, requests, sizes, payloads, workers):
+    started = time.perf_counter()
+    if workers <= 1:
+        run_workload(cache, requests, sizes, payloads)
+    else:
+        children = []
+        for worker in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                run_workload(cache, requests[worker::workers], sizes, payloads)
+                os._exit(0)
+            children.append(pid)
+        for pid in children:
+            os.waitpid(pid, 0)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20000, help='Páginas distintas en la biblioteca')
+    parser.add_argument('--requests', type=int, default=200000, help='Lecturas simuladas')
+    parser.add_argument('--skew', type=float, default=1.0, help='Exponente de la distribución Zipf')
+    parser.add_argument('--mean-kb', type=int, default=300, help='Tamaño medio de página en KB')
+    parser.add_argument('--cache-mb', type=int, nargs='+', default=[64, 256, 1024])
+    parser.add_argument('--workers', type=int, default=1, help='Procesos que comparten la caché')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    requests = zipf_requests(args.pages, args.requests, args.skew, args.seed)
+    sizes = page_sizes(args.pages, args.mean_kb, args.seed)
+    payload_size = max(sizes)
+    payloads = [os.urandom(payload_size)]
+    library_mb = sum(sizes) / (1024 * 1024)
+
+    print(f"Biblioteca: {args.pages} páginas, {library_mb:.0f} MB; {args.requests} lecturas "
+          f"(zipf s={args.skew}), {args.workers} proceso(s)\n")
+    print(f"{'caché':>8} {'admisión':>9} {'aciertos':>9} {'MB usados':>10} {'entradas':>9} "
+          f"{'rechazos':>9} {'lecturas/s':>11}")
+
+    for cache_mb in args.cache_mb:
+        for admission in (False, True):
+            cache = SharedPageCache(
+                cache_mb * 1024 * 1024,
+                max_entries=max(1024, args.pages),
+                admission=admission
+            )
+            elapsed = run(cache, requests, sizes, payloads, args.workers)
+            stats = cache.stats()
+            print(f"{cache_mb:>6}MB {'TinyLFU' if admission else 'FIFO':>9} {stats['hit_ratio']:>9.1%} "
+                  f"{stats['used_bytes'] / (1024 * 1024):>10.0f} {stats['entries']:>9} "
+                  f"{stats['rejections']:>9} {args.requests / elapsed:>11.0f}")
+
+
+if __name__ == '__main__':
+    main()
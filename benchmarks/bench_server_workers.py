@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: rendimiento del servidor de producción según el número de workers
+
+Arranca gunicorn con gunicorn.conf.py sobre una biblioteca sintética en un
+directorio temporal, lanza clientes HTTP concurrentes (varios procesos con
+keep-alive) durante unos segundos y mide peticiones por segundo y latencias para
+cada número de workers. Conviene ejecutarlo en una máquina con varios núcleos.
+
+Uso:
+    python benchmarks/bench_server_workers.py --workers 1 2 4 8 --path /api/mangas/list
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import jwt
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SECRET_KEY = 'your_secret_key_here'
+
+
+def build_library(directory, mangas, pages, page_kb):
+    """Crear una biblioteca sintética y su base de datos en un directorio temporal"""
+    library = os.path.join(directory, 'mangas')
+    for manga in range(mangas):
+        folder = os.path.join(library, f'manga-{manga}')
+        os.makedirs(folder)
+        for page in range(pages):
+            with open(os.path.join(folder, f'{page:03d}.jpg'), 'wb') as f:
+                f.write(os.urandom(page_kb * 1024))
+
+    env = dict(os.environ, PAGE_CACHE_MB='0')
+    subprocess.run([
+        sys.executable, '-c',
+        'import app; app.init_db(); app.init_default_settings(); '
+        f'app.set_setting("manga_directory", {library!r})'
+    ], cwd=directory, env=dict(env, PYTHONPATH=ROOT), check=True, capture_output=True)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'import_mangas.py')],
+                   cwd=directory, check=True, capture_output=True)
+
+    conn = sqlite3.connect(os.path.join(directory, 'manga_reader.db'))
+    count = conn.execute('SELECT COUNT(*) FROM mangas').fetchone()[0]
+    conn.close()
+    return count
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'El servidor no respondió en el puerto {port}')
+
+
+def client(port, path, token, duration, connections, results):
+    """Proceso cliente: varias conexiones keep-alive repartidas en hilos"""
+    import threading
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers={'Cookie': f'token={token}'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                continue
+            local.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=loop) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors[0]))
+
+
+def run_load(port, path, token, duration, clients, connections):
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=client, args=(port, path, token, duration, connections, results))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+    latencies = []
+    errors = 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies.extend(process_latencies)
+        errors += process_errors
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4, help='Hilos por worker')
+    parser.add_argument('--path', default='/api/mangas/list',
+                        help='Ruta a medir (por ejemplo /manga/manga-0/000.jpg)')
+    parser.add_argument('--duration', type=float, default=10, help='Segundos de carga por ronda')
+    parser.add_argument('--clients', type=int, default=max(2, multiprocessing.cpu_count() // 2),
+                        help='Procesos cliente')
+    parser.add_argument('--connections', type=int, default=16, help='Conexiones por proceso cliente')
+    parser.add_argument('--mangas', type=int, default=200)
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--page-kb', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lectorm-bench-')
+    try:
+        count = build_library(workdir, args.mangas, args.pages, args.page_kb)
+        token = jwt.encode({'user_id': 1}, SECRET_KEY, algorithm='HS256')
+
+        print(f"{count} mangas, {os.cpu_count()} núcleos, {args.clients} clientes x "
+              f"{args.connections} conexiones, {args.duration:.0f}s por ronda, GET {args.path}\n")
+        print(f"{'workers':>8} {'hilos':>6} {'pet/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+
+        for workers in args.workers:
+            port = free_port()
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                LECTORM_BIND=f'127.0.0.1:{port}',
+                LECTORM_WORKERS=str(workers),
+                LECTORM_THREADS=str(args.threads),
+                LECTORM_ACCESS_LOG='/dev/null'
+            )
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'),
+                 'app:create_app()'],
+                cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_for_port(port)
+                # Calentar los workers antes de medir
+                run_load(port, args.path, token, 1, 1, workers)
+                latencies, errors = run_load(
+                    port, args.path, token, args.duration, args.clients, args.connections
+                )
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+            print(f"{workers:>8} {args.threads:>6} {len(latencies) / args.duration:>9.0f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{errors:>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: clientes lentos contra el servidor WSGI (gthread) y el ASGI
+
+Arranca gunicorn sobre una biblioteca sintética en cada modo con los mismos
+workers, abre muchas descargas de páginas que leen a un ritmo limitado (como
+lectores con conexiones móviles) y, mientras tanto, mide la latencia de un
+cliente rápido que pide el manifiesto de imágenes. Con hilos, cada descarga
+lenta ocupa un hilo y el cliente rápido hace cola; con ASGI las descargas solo
+ocupan un socket.
+
+Las páginas deben ser mayores que el búfer de envío del kernel (tcp_wmem,
+hasta 4 MB en Linux); si no, el servidor con hilos las vuelca enteras al
+socket y el hilo queda libre aunque el cliente siga leyendo.
+
+La caché de páginas compartida queda activa (--cache-mb, por defecto el tamaño
+de producción), así que se mide el camino real: tras la primera descarga las
+páginas salen de memoria en ambos modos.
+
+Uso:
+    python benchmarks/bench_slow_clients.py --slow-clients 200 --rate-kb 32
+"""
+
+import argparse
+import asyncio
+import http.client
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import jwt
+
+from bench_server_workers import ROOT, SECRET_KEY, build_library, free_port, percentile, wait_for_port
+
+SERVERS = {
+    'sync': ('app:create_app()', {}),
+    'async': ('asgi:create_asgi_app()', {'LECTORM_ASYNC': '1'}),
+}
+
+
+async def slow_download(port, path, token, rate_kb, deadline, stats):
+    """Descargar páginas una y otra vez leyendo a rate_kb KB/s"""
+    block = 4096
+    pause = block / (rate_kb * 1024)
+    while time.perf_counter() < deadline:
+        sock = socket.socket()
+        # Ventana de recepción pequeña: el servidor no puede volcar la página de golpe
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, block)
+        sock.setblocking(False)
+        try:
+            await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+            reader, writer = await asyncio.open_connection(sock=sock)
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: token={token}\r\n'
+                f'Connection: close\r\n\r\n'.encode('latin-1')
+            )
+            await writer.drain()
+            finished = False
+            while time.perf_counter() < deadline:
+                data = await reader.read(block)
+                if not data:
+                    finished = True
+                    break
+                stats['bytes'] += len(data)
+                await asyncio.sleep(pause)
+            writer.close()
+            if finished:
+                stats['completed'] += 1
+        except OSError:
+            stats['errors'] += 1
+            sock.close()
+            await asyncio.sleep(0.1)
+
+
+def run_slow_clients(port, path, token, clients, rate_kb, duration, stats):
+    """Hilo con su propio bucle de eventos para todas las descargas lentas"""
+    async def main():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            slow_download(port, path, token, rate_kb, deadline, stats) for _ in range(clients)
+        ))
+    asyncio.run(main())
+
+
+def probe(port, path, token, duration, timeout):
+    """Peticiones secuenciales de un cliente rápido; devuelve latencias y fallos"""
+    latencies = []
+    failures = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers={'Cookie': f'token={token}'})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+        except (OSError, http.client.HTTPException):
+            failures += 1
+        finally:
+            conn.close()
+        time.sleep(0.05)
+    latencies.sort()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=['sync', 'async'])
+    parser.add_argument('--workers', type=int, default=1, help='Workers de gunicorn en ambos modos')
+    parser.add_argument('--threads', type=int, default=4, help='Hilos por worker en modo sync')
+    parser.add_argument('--slow-clients', type=int, default=200)
+    parser.add_argument('--rate-kb', type=float, default=32, help='KB/s por cliente lento')
+    parser.add_argument('--duration', type=float, default=15, help='Segundos de carga por modo')
+    parser.add_argument('--probe-timeout', type=float, default=5, help='Segundos antes de dar por fallida una petición rápida')
+    parser.add_argument('--page-kb', type=int, default=2048)
+    parser.add_argument('--cache-mb', type=int, default=128, help='PAGE_CACHE_MB del servidor (0 la desactiva)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lectorm-bench-')
+    try:
+        build_library(workdir, mangas=1, pages=3, page_kb=args.page_kb)
+        token = jwt.encode({'user_id': 1}, SECRET_KEY, algorithm='HS256')
+        page_path = '/manga/manga-0/000.jpg'
+        probe_path = '/api/mangas/1/images'
+
+        print(f"{args.slow_clients} clientes lentos a {args.rate_kb:g} KB/s descargando "
+              f"{args.page_kb} KB, {args.workers} worker(s), caché {args.cache_mb} MB, {args.duration:.0f}s por modo; "
+              f"cliente rápido: GET {probe_path}\n")
+        print(f"{'modo':>6} {'descargas':>10} {'MB/s':>7} {'rápido p50 ms':>14} "
+              f"{'rápido p99 ms':>14} {'fallos':>7}")
+
+        for mode in args.modes:
+            target, extra_env = SERVERS[mode]
+            port = free_port()
+            env = dict(
+                os.environ,
+                PYTHONPATH=ROOT,
+                PAGE_CACHE_MB=str(args.cache_mb),
+                LECTORM_BIND=f'127.0.0.1:{port}',
+                LECTORM_WORKERS=str(args.workers),
+                LECTORM_THREADS=str(args.threads),
+                LECTORM_TIMEOUT='300',
+                LECTORM_ACCESS_LOG='/dev/null',
+                **extra_env
+            )
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--config', os.path.join(ROOT, 'gunicorn.conf.py'), target],
+                cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_for_port(port)
+                probe(port, probe_path, token, 1, args.probe_timeout)
+
+                stats = {'completed': 0, 'bytes': 0, 'errors': 0}
+                slow = threading.Thread(target=run_slow_clients, args=(
+                    port, page_path, token, args.slow_clients, args.rate_kb, args.duration, stats
+                ))
+                slow.start()
+                # Dejar que las descargas lentas ocupen el servidor antes de medir
+                time.sleep(1)
+                latencies, failures = probe(port, probe_path, token, args.duration - 2, args.probe_timeout)
+                slow.join()
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+
+            print(f"{mode:>6} {stats['completed']:>10} {stats['bytes'] / args.duration / 1e6:>7.2f} "
+                  f"{percentile(latencies, 0.5) * 1000:>14.1f} {percentile(latencies, 0.99) * 1000:>14.1f} "
+                  f"{failures:>7}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Configuración de gunicorn para producción
+
+    gunicorn --config gunicorn.conf.py "app:create_app()"
+
+Para muchos clientes lentos, servir las páginas con workers ASGI (ver asgi.py):
+
+    LECTORM_ASYNC=1 gunicorn --config gunicorn.conf.py "asgi:create_asgi_app()"
+
+Todos los valores se pueden ajustar con variables de entorno:
+
+    LECTORM_BIND              Dirección de escucha (0.0.0.0:5000)
+    LECTORM_WORKERS           Procesos worker (2 x núcleos + 1)
+    LECTORM_THREADS           Hilos por worker (4; 1 = worker síncrono)
+    LECTORM_ASYNC             1 = workers de uvicorn para asgi.py (0)
+    LECTORM_TIMEOUT           Segundos antes de reiniciar un worker bloqueado (60)
+    LECTORM_GRACEFUL_TIMEOUT  Segundos para terminar peticiones en curso tras SIGTERM (30)
+    LECTORM_KEEPALIVE         Segundos de keep-alive HTTP (5)
+    LECTORM_MAX_REQUESTS      Peticiones antes de reciclar un worker (0 = nunca)
+
+Para el modo réplica (LECTORM_ROLE=replica) ver replication.py y local_cluster.py.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('LECTORM_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('LECTORM_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('LECTORM_THREADS', '4'))
+if os.environ.get('LECTORM_ASYNC', '0') == '1':
+    # Un bucle de eventos por worker; los hilos se configuran en asgi.py
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    worker_class = 'gthread' if threads > 1 else 'sync'
+
+timeout = int(os.environ.get('LECTORM_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('LECTORM_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('LECTORM_KEEPALIVE', '5'))
+max_requests = int(os.environ.get('LECTORM_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+# Cargar la aplicación en el proceso maestro: create_app() inicializa la base de
+# datos y la configuración una sola vez y la caché de páginas compartida se crea
+# antes del fork, así todos los workers usan la misma arena
+preload_app = True
+
+accesslog = os.environ.get('LECTORM_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('LECTORM_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    server.log.info(
+        "Lectorm: %s workers x %s hilos (%s) en %s",
+        workers, threads, worker_class, bind
+    )
+
+
+def post_fork(server, worker):
+    # Arrancar el pool de hash de contraseñas de este worker antes del primer login
+    from app import password_hasher
+    password_hasher.warm_up()
+
+
+def worker_exit(server, worker):
+    # Escribir el progreso y las vistas pendientes antes de terminar
+    from app import progress_writer, view_writer
+    for writer in (progress_writer, view_writer):
+        try:
+            writer.flush()
+        except Exception as e:
+            worker.log.warning("No se pudieron escribir datos pendientes: %s", e)
@@ -5,9 +5,15 @@ Script para importar mangas existentes desde la carpeta de mangas
 
 import sqlite3
 import os
+import re
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import random
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
 def get_image_files(directory):
     """Obtener lista de archivos de imagen en un directorio"""
     image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
@@ -24,6 +30,60 @@ def get_image_files(directory):
     image_files.sort()
     return image_files
 
+def natural_sort_key(filename):
+    """Clave de ordenación natural (page-2 antes que page-10)"""
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', filename)]
+
+def hash_file(path):
+    """Calcular el hash SHA-256 del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_files(cursor, paths, workers=None):
+    """Obtener {ruta: (hash, tamaño, mtime)} reutilizando los hashes cuyo tamaño y mtime no cambiaron"""
+    cached = {
+        path: (size, mtime, content_hash)
+        for path, size, mtime, content_hash in cursor.execute(
+            "SELECT path, size, mtime, content_hash FROM file_hashes"
+        )
+    }
+    
+    results = {}
+    pending = []
+    for path in paths:
+        stat = os.stat(path)
+        entry = cached.get(path)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            results[path] = (entry[2], stat.st_size, stat.st_mtime)
+        else:
+            pending.append((path, stat.st_size, stat.st_mtime))
+    
+    # hashlib libera el GIL sobre bloques grandes, así que los hilos escalan con el disco
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = executor.map(hash_file, [path for path, _, _ in pending])
+        for (path, size, mtime), content_hash in zip(pending, hashes):
+            results[path] = (content_hash, size, mtime)
+            cursor.execute('''
+                INSERT OR REPLACE INTO file_hashes (path, size, mtime, content_hash)
+                VALUES (?, ?, ?, ?)
+            ''', (path, size, mtime, content_hash))
+    
+    print(f"🔑 Hashes: {len(pending)} calculados, {len(paths) - len(pending)} reutilizados")
+    return results
+
+def is_dedup_enabled():
+    """Comprobar si la deduplicación por contenido está activada en la configuración"""
+    try:
+        conn = sqlite3.connect('manga_reader.db')
+        result = conn.execute("SELECT value FROM settings WHERE key = 'content_dedup'").fetchone()
+        conn.close()
+        return bool(result) and result[0].lower() in ('1', 'true', 'yes', 'on')
+    except sqlite3.Error:
+        return False
+
 def get_manga_directory():
     """Obtener el directorio de mangas desde la configuración"""
     try:
@@ -50,7 +110,7 @@ def get_manga_directory():
         # Fallback al directorio por defecto
         return '/home/dev-pc/Documentos/Projects/lectorms/mangas'
 
-def import_mangas_from_directory():
+def import_mangas_from_directory(dedup=False, workers=None):
     """Importar mangas desde el directorio especificado"""
     manga_base_path = get_manga_directory()
     
@@ -64,13 +124,16 @@ def import_mangas_from_directory():
     conn = sqlite3.connect('manga_reader.db')
     cursor = conn.cursor()
     
-    # Limpiar mangas existentes
-    cursor.execute("DELETE FROM mangas")
-    print("✅ Mangas anteriores eliminados")
+    # Limpiar el índice de páginas; los mangas se actualizan conservando su id
+    # para no romper favoritos ni progreso de lectura
+    cursor.execute("DELETE FROM pages")
+    cursor.execute("DELETE FROM blobs")
+    imported_ids = set()
     
     imported_count = 0
     
-    # Recorrer directorios de mangas
+    # Recoger directorios de mangas con imágenes
+    manga_entries = []
     for manga_folder in os.listdir(manga_base_path):
         manga_path = os.path.join(manga_base_path, manga_folder)
         
@@ -78,17 +141,41 @@ def import_mangas_from_directory():
         if not os.path.isdir(manga_path):
             continue
         
+        manga_entries.append((manga_folder, manga_path, get_image_files(manga_path)))
+    
+    # Un listado vacío suele ser un montaje de red caído: no tocar nada
+    if not manga_entries:
+        print(f"⚠️  No se encontraron carpetas en {manga_base_path}; la biblioteca no se modifica")
+        conn.rollback()
+        conn.close()
+        return
+    
+    # Calcular hashes de contenido en paralelo para todas las páginas
+    file_hashes = {}
+    blob_ids = {}
+    dedup_files = 0
+    dedup_bytes = 0
+    if dedup:
+        all_paths = [
+            os.path.join(manga_path, filename)
+            for _, manga_path, image_files in manga_entries
+            for filename in image_files
+        ]
+        file_hashes = hash_files(cursor, all_paths, workers)
+    
+    # Recorrer directorios de mangas
+    for manga_folder, manga_path, image_files in manga_entries:
         print(f"📚 Procesando: {manga_folder}")
         
-        # Obtener imágenes del manga
-        image_files = get_image_files(manga_path)
-        
         if not image_files:
             print(f"  ⚠️  No se encontraron imágenes en {manga_folder}")
             continue
         
         # Generar ID único para el manga
         manga_id = manga_folder.lower().replace(' ', '-').replace('/', '-')
+        if manga_id in imported_ids:
+            print(f"  ⚠️  {manga_folder} tiene el mismo ID que otro manga ({manga_id}), se omite")
+            continue
         
         # Información del manga
         title = manga_folder
@@ -96,6 +183,12 @@ def import_mangas_from_directory():
         first_page = f'/manga/{manga_id}/{image_files[0]}'
         page_count = len(image_files)
         
+        # Portada servida por hash de contenido
+        if dedup:
+            cover_hash = file_hashes[os.path.join(manga_path, image_files[0])][0]
+            cover_image = f'/page/{cover_hash}'
+            first_page = f'/page/{cover_hash}'
+        
         # Generar vistas aleatorias para hacer más realista
         views = random.randint(50, 500)
         
@@ -109,13 +202,19 @@ def import_mangas_from_directory():
         elif any(word in title.lower() for word in ["romance", "amor"]):
             genre = "Romance"
         
-        # Insertar en la base de datos
+        # Insertar en la base de datos (o actualizar si ya existía)
         try:
             cursor.execute('''
                 INSERT INTO mangas (
                     manga_id, title, cover_image, first_page, page_count,
                     description, artist, genres, tags, views, created_at, status
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (manga_id) DO UPDATE SET
+                    title = excluded.title,
+                    cover_image = excluded.cover_image,
+                    first_page = excluded.first_page,
+                    page_count = excluded.page_count,
+                    status = excluded.status
             ''', (
                 manga_id,
                 title,
@@ -131,18 +230,64 @@ def import_mangas_from_directory():
                 "activo"
             ))
             
+            # Índice de páginas apuntando a blobs compartidos
+            if dedup:
+                for page_number, filename in enumerate(sorted(image_files, key=natural_sort_key), 1):
+                    path = os.path.join(manga_path, filename)
+                    content_hash, size, mtime = file_hashes[path]
+                    if content_hash in blob_ids:
+                        dedup_files += 1
+                        dedup_bytes += size
+                    else:
+                        cursor.execute(
+                            "INSERT INTO blobs (content_hash, size, mtime, path) VALUES (?, ?, ?, ?)",
+                            (content_hash, size, mtime, path)
+                        )
+                        blob_ids[content_hash] = cursor.lastrowid
+                    cursor.execute(
+                        "INSERT INTO pages (manga_id, page_number, filename, blob_id) VALUES (?, ?, ?, ?)",
+                        (manga_id, page_number, filename, blob_ids[content_hash])
+                    )
+            
+            imported_ids.add(manga_id)
             imported_count += 1
             print(f"  ✅ Importado: {title} ({page_count} páginas)")
             
         except sqlite3.Error as e:
+            # Conservar el registro existente tal cual
+            imported_ids.add(manga_id)
             print(f"  ❌ Error al importar {title}: {e}")
     
+    # Ocultar (sin borrar) los mangas cuya carpeta ya no está o no tiene imágenes:
+    # favoritos y progreso de lectura se conservan por si la carpeta vuelve
+    if imported_count > 0:
+        cursor.execute("CREATE TEMP TABLE imported (manga_id TEXT PRIMARY KEY)")
+        cursor.executemany("INSERT OR IGNORE INTO imported VALUES (?)", [(i,) for i in imported_ids])
+        cursor.execute('''
+            UPDATE mangas SET status = 'inactivo'
+            WHERE status = 'activo' AND manga_id NOT IN (SELECT manga_id FROM imported)
+        ''')
+        print(f"💤 Mangas desactivados (carpeta no encontrada): {cursor.rowcount}")
+    else:
+        print("⚠️  No se importó ningún manga; no se desactiva ninguno")
+    
+    # Nueva versión de la biblioteca: las réplicas vacían su caché de páginas al verla
+    cursor.execute('''
+        INSERT INTO settings (key, value, description)
+        VALUES ('library_version', ?, 'Versión de la biblioteca (cambia en cada importación)')
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+    ''', (datetime.now().isoformat(),))
+    
     # Confirmar cambios
     conn.commit()
     conn.close()
     
     print(f"\n🎉 Importación completada: {imported_count} mangas importados")
     
+    if dedup:
+        print(f"♻️  Deduplicación: {len(blob_ids)} blobs únicos, {dedup_files} páginas duplicadas, "
+              f"{dedup_bytes} bytes deduplicados ({dedup_bytes / (1024 * 1024):.1f} MB)")
+    
     if imported_count > 0:
         print("\n📋 Mangas importados:")
         conn = sqlite3.connect('manga_reader.db')
@@ -179,6 +324,13 @@ def update_manga_paths():
     print("✅ Rutas de mangas actualizadas")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Importar mangas desde la carpeta configurada')
+    parser.add_argument('--hash', action='store_true',
+                        help='Calcular hash de contenido para deduplicar páginas (o setting content_dedup)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Hilos para calcular hashes en paralelo')
+    args = parser.parse_args()
+    
     print("🚀 Importando mangas existentes...")
-    import_mangas_from_directory()
+    import_mangas_from_directory(dedup=args.hash or is_dedup_enabled(), workers=args.workers)
     print("\n✨ ¡Proceso completado!")
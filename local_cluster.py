@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Arrancar localmente un nodo primario y varias réplicas en puertos consecutivos
+
+El primario usa la base de datos del proyecto (manga_reader.db) y cada réplica
+guarda su instantánea en un directorio temporal. Todos comparten el directorio
+de mangas configurado, como lo harían con un volumen de red.
+
+Uso:
+    python local_cluster.py --replicas 2 --port 5000
+    # primario en :5000, réplicas en :5001 y :5002
+"""
+
+import argparse
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_node(port, workers, extra_env):
+    env = dict(
+        os.environ,
+        LECTORM_BIND=f'127.0.0.1:{port}',
+        LECTORM_WORKERS=str(workers),
+        **extra_env
+    )
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:create_app()'],
+        cwd=ROOT, env=env
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--replicas', type=int, default=2)
+    parser.add_argument('--port', type=int, default=5000, help='Puerto del primario')
+    parser.add_argument('--workers', type=int, default=2, help='Workers por nodo')
+    parser.add_argument('--interval', type=float, default=5, help='Segundos entre instantáneas')
+    args = parser.parse_args()
+
+    token = secrets.token_hex(16)
+    snapshot_dir = tempfile.mkdtemp(prefix='lectorm-replicas-')
+    primary_url = f'http://127.0.0.1:{args.port}'
+
+    nodes = [start_node(args.port, args.workers, {
+        'LECTORM_ROLE': 'primary',
+        'LECTORM_REPLICATION_TOKEN': token
+    })]
+    print(f"🟢 Primario en {primary_url}")
+
+    # Dar tiempo al primario para crear la base de datos antes de las réplicas
+    time.sleep(2)
+    for index in range(1, args.replicas + 1):
+        port = args.port + index
+        nodes.append(start_node(port, args.workers, {
+            'LECTORM_ROLE': 'replica',
+            'LECTORM_PRIMARY_URL': primary_url,
+            'LECTORM_REPLICATION_TOKEN': token,
+            'LECTORM_REPLICA_DB': os.path.join(snapshot_dir, f'replica-{port}.db'),
+            'LECTORM_SNAPSHOT_INTERVAL': str(args.interval)
+        }))
+        print(f"🔵 Réplica en http://127.0.0.1:{port}")
+
+    def stop(*_):
+        for node in nodes:
+            node.send_signal(signal.SIGTERM)
+        for node in nodes:
+            node.wait()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print("Ctrl+C para detener todos los nodos")
+    while all(node.poll() is None for node in nodes):
+        time.sleep(1)
+    stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+Caché en memoria de páginas calientes compartida entre procesos
+
+Los bytes viven en un mmap anónimo compartido (MAP_SHARED): si la caché se crea
+antes de hacer fork, todos los workers ven la misma arena, el mismo índice y las
+mismas estadísticas. La arena es un log circular: las páginas nuevas se escriben
+en la cabeza y las más antiguas se expulsan por la cola. Una página solo entra
+si su frecuencia estimada (TinyLFU, count-min sketch de 4 filas) no es menor que
+la de las páginas que tendría que expulsar, así los accesos únicos no barren las
+páginas populares.
+
+El lock entre procesos se toma siempre con timeout. Si un worker muere mientras
+lo tiene (gunicorn mata con SIGKILL a los workers que superan su timeout), el
+lock queda tomado para siempre: tras varios timeouts seguidos la caché se marca
+como desactivada en la propia arena y todos los procesos sirven desde disco. Para
+recuperarla hay que reiniciar el servidor (con preload_app un HUP no basta, la
+arena y el lock se crean en el proceso maestro).
+"""
+
+import hashlib
+import mmap
+import multiprocessing
+import struct
+
+# Cabecera global: head, tail, entries, hits, misses, admissions, rejections,
+# evictions, sketch_additions (offsets lógicos, crecen sin límite) y disabled
+_HEADER = struct.Struct('<10Q')
+# Slot del índice: clave (digest de 16 bytes) y offset lógico de la entrada
+_SLOT = struct.Struct('<16sQ')
+# Cabecera de cada entrada en la arena: clave, longitud de datos, mtime, longitud del content-type
+_ENTRY = struct.Struct('<16sIdH')
+
+_EMPTY_KEY = bytes(16)
+_SKETCH_ROWS = 4
+_SKETCH_MAX = 15
+_HALVE_TABLE = bytes(i >> 1 for i in range(256))
+
+(_HEAD, _TAIL, _ENTRIES, _HITS, _MISSES,
+ _ADMISSIONS, _REJECTIONS, _EVICTIONS, _SKETCH_ADDITIONS, _DISABLED) = range(10)
+
+# Timeouts seguidos del lock antes de dar la caché por bloqueada
+_LOCK_FAILURES_BEFORE_BYPASS = 3
+
+
+def _next_power_of_two(value):
+    return 1 << max(0, value - 1).bit_length()
+
+
+class SharedPageCache:
+    """Caché de bytes acotada por tamaño, compartida entre procesos hijos"""
+
+    def __init__(self, capacity_bytes, max_entries=8192, max_item_bytes=None, admission=True,
+                 lock_timeout=1.0):
+        self.capacity = capacity_bytes
+        self.lock_timeout = lock_timeout
+        self.max_entries = max_entries
+        self.max_item_bytes = max_item_bytes or capacity_bytes // 8
+        self.admission = admission
+
+        self._slots = _next_power_of_two(max_entries * 2)
+        self._sketch_width = _next_power_of_two(max_entries * 4)
+        self._sketch_sample = max_entries * 10
+
+        self._index_start = _HEADER.size
+        self._sketch_start = self._index_start + self._slots * _SLOT.size
+        self._data_start = self._sketch_start + _SKETCH_ROWS * self._sketch_width
+
+        self._arena = mmap.mmap(-1, self._data_start + capacity_bytes)
+        self._lock = multiprocessing.Lock()
+        self._lock_failures = 0
+
+    # Cabecera global
+
+    def _get(self, field):
+        return struct.unpack_from('<Q', self._arena, field * 8)[0]
+
+    def _set(self, field, value):
+        struct.pack_into('<Q', self._arena, field * 8, value)
+
+    def _incr(self, field, amount=1):
+        self._set(field, self._get(field) + amount)
+
+    def _acquire(self, timeout=None):
+        """Tomar el lock; timeout=0 no espera. Devuelve False si hay que ir a disco"""
+        if self._get(_DISABLED):
+            return False
+        if timeout == 0:
+            # Lock ocupado por otro proceso: se trata como un fallo de caché
+            return self._lock.acquire(False)
+        if self._lock.acquire(timeout=self.lock_timeout if timeout is None else timeout):
+            self._lock_failures = 0
+            return True
+
+        self._lock_failures += 1
+        if self._lock_failures >= _LOCK_FAILURES_BEFORE_BYPASS:
+            # Sin el lock no se puede tocar la arena; basta con escribir el indicador
+            self._set(_DISABLED, 1)
+            print("⚠️  Caché de páginas desactivada: el lock no responde "
+                  "(¿un worker murió con él tomado?). Reinicia el servidor para recuperarla")
+        return False
+
+    @property
+    def disabled(self):
+        return bool(self._get(_DISABLED))
+
+    # Índice hash con sondeo lineal
+
+    def _home(self, key):
+        return int.from_bytes(key[:8], 'little') & (self._slots - 1)
+
+    def _slot_at(self, slot):
+        return _SLOT.unpack_from(self._arena, self._index_start + slot * _SLOT.size)
+
+    def _write_slot(self, slot, key, offset):
+        _SLOT.pack_into(self._arena, self._index_start + slot * _SLOT.size, key, offset)
+
+    def _find(self, key):
+        slot = self._home(key)
+        while True:
+            slot_key, offset = self._slot_at(slot)
+            if slot_key == _EMPTY_KEY:
+                return slot, None
+            if slot_key == key:
+                return slot, offset
+            slot = (slot + 1) & (self._slots - 1)
+
+    def _index_delete(self, slot):
+        """Borrar un slot desplazando hacia atrás los siguientes (sin lápidas)"""
+        mask = self._slots - 1
+        hole = slot
+        current = slot
+        while True:
+            current = (current + 1) & mask
+            key, offset = self._slot_at(current)
+            if key == _EMPTY_KEY:
+                break
+            home = self._home(key)
+            # Mover la entrada al hueco si su posición ideal no está entre el hueco y ella
+            if (current > hole and (home <= hole or home > current)) or \
+               (current < hole and home <= hole and home > current):
+                self._write_slot(hole, key, offset)
+                hole = current
+        self._write_slot(hole, _EMPTY_KEY, 0)
+
+    # Count-min sketch para la admisión TinyLFU
+
+    def _sketch_positions(self, key):
+        for row in range(_SKETCH_ROWS):
+            column = int.from_bytes(key[row * 4:row * 4 + 4], 'little') & (self._sketch_width - 1)
+            yield self._sketch_start + row * self._sketch_width + column
+
+    def _frequency(self, key):
+        return min(self._arena[position] for position in self._sketch_positions(key))
+
+    def _record_access(self, key):
+        positions = list(self._sketch_positions(key))
+        current = min(self._arena[position] for position in positions)
+        if current < _SKETCH_MAX:
+            # Actualización conservadora: solo suben los contadores mínimos
+            for position in positions:
+                if self._arena[position] == current:
+                    self._arena[position] = current + 1
+
+        self._incr(_SKETCH_ADDITIONS)
+        if self._get(_SKETCH_ADDITIONS) >= self._sketch_sample:
+            # Envejecer: dividir a la mitad todos los contadores
+            end = self._sketch_start + _SKETCH_ROWS * self._sketch_width
+            self._arena[self._sketch_start:end] = self._arena[self._sketch_start:end].translate(_HALVE_TABLE)
+            self._set(_SKETCH_ADDITIONS, 0)
+
+    # Arena circular
+
+    def _physical(self, offset):
+        return self._data_start + offset % self.capacity
+
+    def _entry_at(self, offset):
+        """Devolver (clave, tamaño total) de la entrada en un offset lógico"""
+        remaining = self.capacity - offset % self.capacity
+        if remaining < _ENTRY.size:
+            # Hueco demasiado pequeño para una cabecera: fin de vuelta implícito
+            return _EMPTY_KEY, remaining
+        key, data_len, _, ctype_len = _ENTRY.unpack_from(self._arena, self._physical(offset))
+        if key == _EMPTY_KEY:
+            # Relleno hasta el final de la arena
+            return key, data_len
+        return key, _ENTRY.size + ctype_len + data_len
+
+    def _evict_tail(self):
+        tail = self._get(_TAIL)
+        key, size = self._entry_at(tail)
+        if key != _EMPTY_KEY:
+            slot, offset = self._find(key)
+            # Solo borrar del índice si apunta a esta copia
+            if offset == tail:
+                self._index_delete(slot)
+                self._incr(_ENTRIES, -1)
+                self._incr(_EVICTIONS)
+        self._set(_TAIL, tail + size)
+
+    def _victims_allow(self, candidate_key, needed, head):
+        """Comprobar la admisión TinyLFU contra las entradas que habría que expulsar"""
+        candidate_frequency = self._frequency(candidate_key)
+        tail = self._get(_TAIL)
+        entries = self._get(_ENTRIES)
+        while head + needed - tail > self.capacity or entries >= self.max_entries:
+            if tail >= head:
+                break
+            key, size = self._entry_at(tail)
+            if key != _EMPTY_KEY:
+                if self._find(key)[1] == tail:
+                    if self._frequency(key) > candidate_frequency:
+                        return False
+                    entries -= 1
+            tail += size
+        return True
+
+    # API pública
+
+    @staticmethod
+    def make_key(name):
+        return hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, name, timeout=None):
+        """Obtener (bytes, content_type, mtime) o None; registra el acceso en el sketch
+
+        Si el lock no se consigue en timeout segundos (0 = sin esperar) se
+        devuelve None, como un fallo de caché.
+        """
+        key = self.make_key(name)
+        if not self._acquire(timeout):
+            return None
+        try:
+            self._record_access(key)
+            _, offset = self._find(key)
+            if offset is None:
+                self._incr(_MISSES)
+                return None
+            position = self._physical(offset)
+            _, data_len, mtime, ctype_len = _ENTRY.unpack_from(self._arena, position)
+            start = position + _ENTRY.size
+            content_type = self._arena[start:start + ctype_len].decode('ascii')
+            data = self._arena[start + ctype_len:start + ctype_len + data_len]
+            self._incr(_HITS)
+        finally:
+            self._lock.release()
+        return data, content_type, mtime
+
+    def lookup(self, name, timeout=None):
+        """Como get() pero sin copiar los bytes: (tamaño, content_type, mtime) o None
+
+        Para servir páginas por bloques con read() sin retener la página entera.
+        """
+        key = self.make_key(name)
+        if not self._acquire(timeout):
+            return None
+        try:
+            self._record_access(key)
+            _, offset = self._find(key)
+            if offset is None:
+                self._incr(_MISSES)
+                return None
+            position = self._physical(offset)
+            _, data_len, mtime, ctype_len = _ENTRY.unpack_from(self._arena, position)
+            start = position + _ENTRY.size
+            content_type = self._arena[start:start + ctype_len].decode('ascii')
+            self._incr(_HITS)
+        finally:
+            self._lock.release()
+        return data_len, content_type, mtime
+
+    def read(self, name, start, length, mtime, timeout=None):
+        """Copiar un tramo de una página; None si ya no está en caché o cambió su mtime"""
+        key = self.make_key(name)
+        if not self._acquire(timeout):
+            return None
+        try:
+            _, offset = self._find(key)
+            if offset is None:
+                return None
+            position = self._physical(offset)
+            _, data_len, entry_mtime, ctype_len = _ENTRY.unpack_from(self._arena, position)
+            if entry_mtime != mtime:
+                return None
+            data_start = position + _ENTRY.size + ctype_len
+            end = min(start + length, data_len)
+            return self._arena[data_start + start:data_start + end] if start < end else b''
+        finally:
+            self._lock.release()
+
+    def put(self, name, data, content_type, mtime=0.0, timeout=None):
+        """Guardar una página si la política de admisión lo permite; devuelve si se admitió"""
+        key = self.make_key(name)
+        ctype = content_type.encode('ascii')
+        size = _ENTRY.size + len(ctype) + len(data)
+        if len(data) > self.max_item_bytes or size > self.capacity:
+            return False
+
+        if not self._acquire(timeout):
+            return False
+        try:
+            if self._find(key)[1] is not None:
+                return True
+
+            head = self._get(_HEAD)
+            padding = 0
+            if head % self.capacity + size > self.capacity:
+                padding = self.capacity - head % self.capacity
+
+            if self.admission and not self._victims_allow(key, padding + size, head):
+                self._incr(_REJECTIONS)
+                return False
+
+            while (head + padding + size - self._get(_TAIL) > self.capacity or
+                   self._get(_ENTRIES) >= self.max_entries) and self._get(_TAIL) < head:
+                self._evict_tail()
+
+            if padding and self._get(_TAIL) == head:
+                # Caché vacía: empezar directamente desde el inicio de la arena
+                head += padding
+                self._set(_TAIL, head)
+                padding = 0
+
+            if padding:
+                if padding >= _ENTRY.size:
+                    _ENTRY.pack_into(self._arena, self._physical(head), _EMPTY_KEY, padding, 0.0, 0)
+                head += padding
+
+            position = self._physical(head)
+            _ENTRY.pack_into(self._arena, position, key, len(data), mtime, len(ctype))
+            start = position + _ENTRY.size
+            self._arena[start:start + len(ctype)] = ctype
+            self._arena[start + len(ctype):start + len(ctype) + len(data)] = data
+
+            slot, _ = self._find(key)
+            self._write_slot(slot, key, head)
+            self._set(_HEAD, head + size)
+            self._incr(_ENTRIES)
+            self._incr(_ADMISSIONS)
+        finally:
+            self._lock.release()
+        return True
+
+    def clear(self):
+        """Vaciar la caché (por ejemplo tras reimportar la biblioteca); devuelve si se vació"""
+        if not self._acquire():
+            return False
+        try:
+            self._arena[:self._data_start] = bytes(self._data_start)
+        finally:
+            self._lock.release()
+        return True
+
+    def stats(self):
+        if self._acquire():
+            try:
+                values = _HEADER.unpack_from(self._arena, 0)
+            finally:
+                self._lock.release()
+        else:
+            # Lectura sin lock: valores aproximados, suficientes para diagnosticar
+            values = _HEADER.unpack_from(self._arena, 0)
+        hits, misses = values[_HITS], values[_MISSES]
+        return {
+            'capacity_bytes': self.capacity,
+            'used_bytes': values[_HEAD] - values[_TAIL],
+            'arena_bytes': len(self._arena),
+            'entries': values[_ENTRIES],
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'admissions': values[_ADMISSIONS],
+            'rejections': values[_REJECTIONS],
+            'evictions': values[_EVICTIONS],
+            'disabled': bool(values[_DISABLED])
+        }
@@ -0,0 +1,113 @@
+"""
+Hash y verificación de contraseñas en un pool de procesos acotado
+
+Los hashes de contraseña son caros a propósito. Ejecutarlos en los hilos del
+servidor hace que una ráfaga de logins deje sin hilos a la lectura de páginas,
+así que se delegan a un pequeño pool de procesos con un límite de trabajos
+pendientes: cuando está lleno se rechaza al instante en lugar de encolar.
+
+Los límites son de todo el servidor, no de cada worker: los semáforos se crean
+en el proceso maestro antes del fork (preload_app) y los comparten todos los
+workers de gunicorn, así una ráfaga de logins nunca ocupa más de `workers`
+núcleos aunque haya muchos workers. Si un worker muere a mitad de un hash su
+plaza no se recupera hasta reiniciar el servidor; mientras tanto las
+peticiones esperan como mucho `timeout` y responden "ocupado".
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """El pool de hash está saturado o no respondió a tiempo"""
+
+
+class PasswordHasher:
+    """Pool de procesos para generar y verificar hashes de contraseña"""
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=2, max_pending=16, timeout=10):
+        # workers: hashes simultáneos en todo el servidor (núcleos dedicados);
+        # max_pending: trabajos en curso o en espera en todo el servidor
+        self.method = method
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        # werkzeug amplía los nombres cortos ('scrypt' -> 'scrypt:32768:8:1'),
+        # así que se compara con el prefijo real que genera el método
+        self.method_prefix = generate_password_hash('', method).split('$', 1)[0]
+        self._slots = multiprocessing.BoundedSemaphore(max_pending)
+        self._cores = multiprocessing.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Cada worker de gunicorn necesita su propio pool (no se hereda por fork);
+        # los procesos se arrancan bajo demanda y el semáforo compartido limita
+        # cuántos calculan a la vez
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self):
+        self._cores.release()
+        self._slots.release()
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(block=False):
+            raise HasherBusy('Demasiadas solicitudes de autenticación en curso')
+        # Esperar un núcleo libre en todo el servidor antes de entregar el trabajo
+        if not self._cores.acquire(timeout=self.timeout):
+            self._slots.release()
+            raise HasherBusy('El hash de contraseña tardó demasiado')
+        try:
+            future = self._get_executor().submit(func, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._release()
+            self._reset_executor()
+            raise HasherBusy('El pool de hash no está disponible')
+        # Liberar al terminar el hash, no al agotar la espera: si no, un hash
+        # abandonado seguiría ocupando un núcleo fuera del límite
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy('El hash de contraseña tardó demasiado')
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise HasherBusy('El pool de hash no está disponible')
+
+    def warm_up(self):
+        """Arrancar un proceso del pool antes de la primera petición
+
+        Solo uno por worker: con muchos workers, arrancarlos todos dejaría
+        decenas de procesos ociosos; los demás se crean si hay logins simultáneos.
+        """
+        self._get_executor().submit(os.getpid).result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Comprobar si un hash se generó con un método o coste distinto del actual"""
+        return password_hash.split('$', 1)[0] != self.method_prefix
@@ -0,0 +1,244 @@
+"""
+Modo réplica: nodos de solo lectura alimentados con instantáneas del primario
+
+El nodo primario ejecuta las importaciones y todas las escrituras. Los nodos
+réplica descargan periódicamente una instantánea consistente de la base de
+datos (API de backup de SQLite), la verifican y la sustituyen de forma atómica
+con os.replace: las conexiones abiertas siguen leyendo la copia anterior y las
+nuevas ven la nueva. Las escrituras se reenvían al primario o se acumulan y se
+envían en lotes.
+
+Con preload_app el hilo de sincronización vive en el proceso maestro de
+gunicorn; el estado (versión, última sincronización, último error) se publica
+en un archivo junto a la instantánea para que cualquier worker pueda leerlo.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+REPLICATION_TOKEN_HEADER = 'X-Replication-Token'
+
+# Cabeceras de la petición original que se reenvían al primario
+FORWARDED_REQUEST_HEADERS = {'cookie', 'content-type', 'x-access-token', 'accept', 'user-agent'}
+# Cabeceras de la respuesta del primario que se devuelven al cliente
+FORWARDED_RESPONSE_HEADERS = {'content-type', 'set-cookie', 'retry-after', 'cache-control', 'location'}
+
+
+class PrimaryUnavailable(Exception):
+    """El nodo primario no respondió"""
+
+
+def database_version(db_path):
+    """Versión barata de la base de datos a partir de mtime y tamaño de sus archivos"""
+    parts = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+            parts.append(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        except FileNotFoundError:
+            pass
+    return '.'.join(parts)
+
+
+def create_snapshot(db_path, directory=None):
+    """Copiar la base de datos a un archivo temporal con la API de backup de SQLite"""
+    fd, snapshot_path = tempfile.mkstemp(suffix='.db', dir=directory)
+    os.close(fd)
+    source = sqlite3.connect(db_path)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return snapshot_path
+
+
+def readonly_uri(path):
+    """URI de SQLite para abrir una instantánea inmutable en solo lectura"""
+    return 'file:' + urllib.request.pathname2url(os.path.abspath(path)) + '?mode=ro&immutable=1'
+
+
+def post_to_primary(primary_url, token, path, payload, timeout=10):
+    """Enviar un lote de escrituras al endpoint interno del primario"""
+    request = urllib.request.Request(
+        primary_url.rstrip('/') + path,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json', REPLICATION_TOKEN_HEADER: token},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read() or b'null')
+    except (urllib.error.URLError, OSError) as e:
+        raise PrimaryUnavailable(str(e))
+
+
+def forward_request(primary_url, flask_request, timeout=10):
+    """Reenviar la petición actual al primario; devuelve (estado, cabeceras, cuerpo)"""
+    url = primary_url.rstrip('/') + flask_request.path
+    if flask_request.query_string:
+        url += '?' + flask_request.query_string.decode('latin-1')
+
+    headers = {
+        name: value for name, value in flask_request.headers.items()
+        if name.lower() in FORWARDED_REQUEST_HEADERS
+    }
+    request = urllib.request.Request(
+        url,
+        data=flask_request.get_data() or None,
+        headers=headers,
+        method=flask_request.method
+    )
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        response = e
+    except (urllib.error.URLError, OSError) as e:
+        raise PrimaryUnavailable(str(e))
+
+    with response:
+        body = response.read()
+        response_headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() in FORWARDED_RESPONSE_HEADERS
+        ]
+        return response.status, response_headers, body
+
+
+class SnapshotSync:
+    """Descarga periódica e intercambio atómico de la instantánea del primario"""
+
+    def __init__(self, primary_url, token, snapshot_path, interval=30, on_swap=None):
+        self.primary_url = primary_url.rstrip('/')
+        self.token = token
+        self.snapshot_path = os.path.abspath(snapshot_path)
+        self.status_path = self.snapshot_path + '.sync.json'
+        self.interval = interval
+        self.on_swap = on_swap
+        self.version = None
+        self.last_sync = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def sync_once(self):
+        """Descargar la instantánea si cambió; devuelve True si se sustituyó"""
+        with self._lock:
+            headers = {REPLICATION_TOKEN_HEADER: self.token}
+            if self.version:
+                headers['If-None-Match'] = f'"{self.version}"'
+            request = urllib.request.Request(
+                self.primary_url + '/api/replication/snapshot', headers=headers
+            )
+
+            directory = os.path.dirname(self.snapshot_path)
+            fd, download_path = tempfile.mkstemp(suffix='.download', dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    try:
+                        with urllib.request.urlopen(request, timeout=60) as response:
+                            while True:
+                                chunk = response.read(1024 * 1024)
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                            version = response.headers.get('ETag', '').strip('"')
+                    except urllib.error.HTTPError as e:
+                        if e.code == 304:
+                            self.last_sync = time.time()
+                            self.last_error = None
+                            self._write_status()
+                            return False
+                        raise
+
+                # Verificar antes de publicar la nueva copia
+                conn = sqlite3.connect(readonly_uri(download_path), uri=True)
+                try:
+                    result = conn.execute('PRAGMA quick_check').fetchone()[0]
+                finally:
+                    conn.close()
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(f'Instantánea corrupta: {result}')
+
+                os.replace(download_path, self.snapshot_path)
+            finally:
+                if os.path.exists(download_path):
+                    os.remove(download_path)
+
+            self.version = version
+            self.last_sync = time.time()
+            self.last_error = None
+            self._write_status()
+
+        if self.on_swap:
+            self.on_swap()
+        return True
+
+    def wait_for_first(self, timeout=60):
+        """Bloquear hasta tener una instantánea (o usar la existente si el primario no responde)"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.sync_once()
+                return True
+            except Exception as e:
+                self._record_error(e)
+                if time.time() > deadline:
+                    return os.path.exists(self.snapshot_path)
+                time.sleep(1)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Cualquier fallo (también IncompleteRead o BadStatusLine si el
+            # primario se reinicia a mitad de descarga) no debe matar el hilo
+            try:
+                self.sync_once()
+            except Exception as e:
+                self._record_error(e)
+                print(f"Error al sincronizar la instantánea: {e}")
+
+    def _record_error(self, error):
+        self.last_error = f'{type(error).__name__}: {error}'
+        self._write_status()
+
+    def _write_status(self):
+        """Publicar el estado para los workers, que no comparten este objeto"""
+        directory = os.path.dirname(self.status_path)
+        try:
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'version': self.version,
+                    'last_sync': self.last_sync,
+                    'last_error': self.last_error
+                }, f)
+            os.replace(tmp_path, self.status_path)
+        except OSError as e:
+            print(f"No se pudo guardar el estado de la réplica: {e}")
+
+    def status(self):
+        status = {
+            'version': self.version,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error
+        }
+        try:
+            with open(self.status_path) as f:
+                status.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        status['snapshot_path'] = self.snapshot_path
+        return status
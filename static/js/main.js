@@ -19,6 +19,8 @@ async function initializeApp() {
         
         await fetchMangaList();
         await fetchPopularMangas();
+        await fetchShelf('/api/progress/continue?limit=10', 'continue-section', 'continue-grid');
+        await fetchShelf('/api/favorites', 'favorites-section', 'favorites-grid');
         await fetchUserInfo();
         
         setupSearchInput();
@@ -152,6 +154,11 @@ async function handleLogout() {
         localStorage.removeItem('user');
         localStorage.removeItem('theme');
         
+        // Borrar las páginas y el catálogo guardados sin conexión
+        if (typeof clearOfflineData === 'function') {
+            await clearOfflineData();
+        }
+        
         // Mostrar notificación
         console.log('✅ Mostrando notificación...');
         showNotification('Sesión cerrada exitosamente', 'success');
@@ -194,6 +201,24 @@ async function fetchPopularMangas() {
     }
 }
 
+async function fetchShelf(url, sectionId, gridId) {
+    const section = document.getElementById(sectionId);
+    const grid = document.getElementById(gridId);
+    if (!section || !grid) return;
+    
+    try {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Error al cargar la estantería');
+        
+        const mangas = await response.json();
+        grid.innerHTML = '';
+        mangas.forEach(manga => grid.appendChild(createMangaCard(manga)));
+        section.style.display = mangas.length ? '' : 'none';
+    } catch (error) {
+        console.error(`Error al cargar ${url}:`, error);
+    }
+}
+
 async function fetchUserInfo() {
     try {
         const response = await fetch('/api/auth/user');
@@ -0,0 +1,102 @@
+// Lectura sin conexión: registro del service worker y acciones de guardado
+
+const offlineListeners = new Set();
+
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js', { scope: '/' }).catch(error => {
+            console.error('❌ Error al registrar el service worker:', error);
+        });
+    });
+
+    navigator.serviceWorker.addEventListener('message', event => {
+        offlineListeners.forEach(listener => listener(event.data || {}));
+    });
+}
+
+async function postToServiceWorker(message) {
+    if (!('serviceWorker' in navigator)) {
+        throw new Error('El navegador no permite la lectura sin conexión');
+    }
+    const registration = await navigator.serviceWorker.ready;
+    registration.active.postMessage(message);
+}
+
+function saveChapterOffline(mangaId) {
+    return postToServiceWorker({ type: 'save-chapter', mangaId: String(mangaId) });
+}
+
+function removeChapterOffline(mangaId) {
+    return postToServiceWorker({ type: 'remove-chapter', mangaId: String(mangaId) });
+}
+
+async function clearOfflineData() {
+    if (!('serviceWorker' in navigator)) return;
+    const registration = await navigator.serviceWorker.getRegistration('/');
+    if (registration && registration.active) {
+        registration.active.postMessage({ type: 'clear' });
+    }
+}
+
+// Conectar un botón de "guardar sin conexión" con su etiqueta de estado
+function setupOfflineButton(button, label, mangaId) {
+    if (!button) return;
+    mangaId = String(mangaId);
+
+    if (!('serviceWorker' in navigator)) {
+        button.style.display = 'none';
+        return;
+    }
+
+    let saved = false;
+    let saving = false;
+    const icon = button.querySelector('.material-icons');
+    const setState = (text, iconName) => {
+        if (label) label.textContent = text;
+        button.title = text;
+        if (icon) icon.textContent = iconName;
+    };
+
+    offlineListeners.add(data => {
+        if (data.mangaId !== mangaId) return;
+
+        if (data.type === 'chapter-status') {
+            saved = data.savedPages > 0;
+            if (saved) setState('Guardado sin conexión', 'offline_pin');
+        } else if (data.type === 'save-progress') {
+            setState(`Descargando ${data.done}/${data.total}`, 'downloading');
+        } else if (data.type === 'save-complete') {
+            saving = false;
+            saved = data.failed < data.total;
+            if (data.failed) {
+                setState(`Guardado (${data.failed} páginas fallaron)`, 'offline_pin');
+            } else {
+                setState('Guardado sin conexión', 'offline_pin');
+            }
+        } else if (data.type === 'save-error') {
+            saving = false;
+            setState('Error al guardar', 'error');
+        } else if (data.type === 'remove-complete') {
+            saved = false;
+            setState('Guardar sin conexión', 'download_for_offline');
+        }
+    });
+
+    button.addEventListener('click', async () => {
+        if (saving) return;
+        try {
+            if (saved) {
+                await removeChapterOffline(mangaId);
+            } else {
+                saving = true;
+                setState('Preparando descarga...', 'downloading');
+                await saveChapterOffline(mangaId);
+            }
+        } catch (error) {
+            saving = false;
+            setState(error.message, 'error');
+        }
+    });
+
+    postToServiceWorker({ type: 'chapter-status', mangaId }).catch(() => {});
+}
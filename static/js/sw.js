@@ -0,0 +1,381 @@
+// Service worker: caché offline de páginas de manga y del catálogo
+//
+// - Páginas por hash (/page/<hash>): cache-first, su contenido nunca cambia
+// - Imágenes por nombre (/manga/<id>/<archivo>): red primero (el navegador revalida
+//   con Last-Modified, así se ve una página reemplazada), caché si no hay conexión
+// - Catálogo y manifiestos (/api/mangas/list, /api/mangas/<id>, /api/mangas/<id>/images):
+//   stale-while-revalidate; al marcar o quitar un favorito se renueva el detalle
+// - Páginas HTML (/, /manga/<id>, /read/<id>): red primero, caché si no hay conexión
+//
+// Las imágenes se expulsan por LRU al superar la cuota; las de capítulos
+// guardados explícitamente para leer offline quedan fijadas.
+
+const CACHE_VERSION = 'v1';
+const IMAGE_CACHE = `lectorm-images-${CACHE_VERSION}`;
+const API_CACHE = `lectorm-api-${CACHE_VERSION}`;
+const SHELL_CACHE = `lectorm-shell-${CACHE_VERSION}`;
+const CURRENT_CACHES = [IMAGE_CACHE, API_CACHE, SHELL_CACHE];
+
+const MAX_IMAGE_CACHE_BYTES = 300 * 1024 * 1024;
+const QUOTA_FRACTION = 0.5;          // Nunca más de la mitad de la cuota del navegador
+const PREFETCH_CONCURRENCY = 3;
+const EVICTION_DELAY_MS = 2000;
+
+const BLOB_PATTERN = /^\/page\/[0-9a-f]+$/;
+const MANGA_FILE_PATTERN = /^\/manga\/[^/]+\/[^/]+$/;
+const FAVORITE_PATTERN = /^\/api\/favorites\/(\d+)$/;
+const API_PATTERN = /^\/api\/mangas\/(list|\d+|\d+\/images)$/;
+const SHELL_PATTERN = /^\/(|manga\/\d+|read\/\d+)$/;
+
+self.addEventListener('install', () => {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names
+            .filter(name => name.startsWith('lectorm-') && !CURRENT_CACHES.includes(name))
+            .map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+
+    if (request.method !== 'GET') {
+        const favorite = FAVORITE_PATTERN.exec(url.pathname);
+        if (favorite && (request.method === 'PUT' || request.method === 'DELETE')) {
+            event.respondWith(updateFavorite(request, event, favorite[1]));
+        }
+        return;
+    }
+
+    if (BLOB_PATTERN.test(url.pathname)) {
+        event.respondWith(cacheFirst(request, event));
+    } else if (MANGA_FILE_PATTERN.test(url.pathname)) {
+        event.respondWith(networkFirstImage(request, event));
+    } else if (API_PATTERN.test(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(request, event));
+    } else if (request.mode === 'navigate' && SHELL_PATTERN.test(url.pathname)) {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+self.addEventListener('message', event => {
+    const data = event.data || {};
+    if (data.type === 'save-chapter') {
+        event.waitUntil(saveChapter(data.mangaId, event.source));
+    } else if (data.type === 'remove-chapter') {
+        event.waitUntil(removeChapter(data.mangaId, event.source));
+    } else if (data.type === 'chapter-status') {
+        event.waitUntil(chapterStatus(data.mangaId, event.source));
+    } else if (data.type === 'clear') {
+        event.waitUntil(clearAll());
+    }
+});
+
+// Estrategias
+
+async function cacheFirst(request, event) {
+    const cache = await caches.open(IMAGE_CACHE);
+    const cached = await cache.match(request);
+    if (cached) {
+        event.waitUntil(touchEntry(request.url));
+        return cached;
+    }
+
+    const response = await fetch(request);
+    // Una sesión caducada redirige a /login: no guardar esa respuesta como imagen
+    if (response.ok && !response.redirected) {
+        event.waitUntil(storeImage(cache, request.url, response.clone()));
+    }
+    return response;
+}
+
+async function networkFirstImage(request, event) {
+    const cache = await caches.open(IMAGE_CACHE);
+    let response;
+    try {
+        response = await fetch(request);
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (!cached) throw error;
+        event.waitUntil(touchEntry(request.url));
+        return cached;
+    }
+
+    // Guardar la versión vigente (conserva la marca de capítulo guardado)
+    if (response.ok && !response.redirected) {
+        event.waitUntil(storeImage(cache, request.url, response.clone()));
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(request, event) {
+    const cache = await caches.open(API_CACHE);
+    const cached = await cache.match(request);
+
+    const network = fetch(request).then(response => {
+        if (response.ok) {
+            return cache.put(request, response.clone()).then(() => response);
+        }
+        return response;
+    });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }
+    return network;
+}
+
+async function networkFirst(request) {
+    const cache = await caches.open(SHELL_CACHE);
+    try {
+        const response = await fetch(request);
+        // No guardar redirecciones a /login
+        if (response.ok && !response.redirected) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+async function updateFavorite(request, event, mangaId) {
+    const response = await fetch(request);
+    // is_favorite forma parte del detalle del manga: renovar la copia en caché
+    if (response.ok) {
+        event.waitUntil(refreshMangaDetail(mangaId));
+    }
+    return response;
+}
+
+async function refreshMangaDetail(mangaId) {
+    const cache = await caches.open(API_CACHE);
+    const detailUrl = `/api/mangas/${mangaId}`;
+    try {
+        const response = await fetch(detailUrl, { cache: 'no-store' });
+        if (response.ok) {
+            await cache.put(detailUrl, response);
+            return;
+        }
+    } catch (error) {
+        // Sin conexión: mejor sin copia que con una desactualizada
+    }
+    await cache.delete(detailUrl);
+}
+
+// Metadatos LRU en IndexedDB: url, tamaño, último acceso y capítulos guardados
+// que la usan (owners). Una página por hash puede pertenecer a varios capítulos;
+// queda fijada mientras alguno de ellos siga guardado.
+
+let metaDbPromise = null;
+
+function openMetaDb() {
+    if (!metaDbPromise) {
+        metaDbPromise = new Promise((resolve, reject) => {
+            const open = indexedDB.open('lectorm-offline', 1);
+            open.onupgradeneeded = () => {
+                const store = open.result.createObjectStore('entries', { keyPath: 'url' });
+                store.createIndex('owners', 'owners', { multiEntry: true });
+            };
+            open.onsuccess = () => resolve(open.result);
+            open.onerror = () => reject(open.error);
+        });
+    }
+    return metaDbPromise;
+}
+
+async function withStore(mode, callback) {
+    const db = await openMetaDb();
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction('entries', mode);
+        const result = callback(transaction.objectStore('entries'));
+        transaction.oncomplete = () => resolve(result instanceof IDBRequest ? result.result : result);
+        transaction.onerror = () => reject(transaction.error);
+    });
+}
+
+function getAllEntries() {
+    return withStore('readonly', store => store.getAll());
+}
+
+function getChapterEntries(mangaId) {
+    return withStore('readonly', store => store.index('owners').getAll(mangaId));
+}
+
+function isPinned(entry) {
+    return Boolean(entry.owners && entry.owners.length);
+}
+
+// Leer y reescribir una entrada en la misma transacción: dos capítulos que
+// comparten página pueden guardarse a la vez sin perder ningún propietario
+function updateEntry(url, update) {
+    return withStore('readwrite', store => {
+        const request = store.get(url);
+        request.onsuccess = () => {
+            const entry = update(request.result);
+            if (entry) store.put(entry);
+        };
+    });
+}
+
+function touchEntry(url) {
+    return updateEntry(url, entry => entry && { ...entry, lastAccess: Date.now() });
+}
+
+async function storeImage(cache, url, response, owner = null) {
+    const blob = await response.clone().blob();
+    await cache.put(url, response);
+
+    await updateEntry(url, existing => {
+        const owners = new Set(existing ? existing.owners : []);
+        if (owner !== null) owners.add(owner);
+        return { url, size: blob.size, lastAccess: Date.now(), owners: [...owners] };
+    });
+    scheduleEviction();
+}
+
+// Expulsión LRU
+
+let evictionTimer = null;
+
+function scheduleEviction() {
+    clearTimeout(evictionTimer);
+    evictionTimer = setTimeout(() => evictToQuota().catch(error => {
+        console.error('Error al liberar la caché offline:', error);
+    }), EVICTION_DELAY_MS);
+}
+
+async function imageQuota() {
+    let quota = MAX_IMAGE_CACHE_BYTES;
+    if (self.navigator.storage && self.navigator.storage.estimate) {
+        const estimate = await self.navigator.storage.estimate();
+        if (estimate.quota) {
+            quota = Math.min(quota, estimate.quota * QUOTA_FRACTION);
+        }
+    }
+    return quota;
+}
+
+async function evictToQuota() {
+    const quota = await imageQuota();
+    const entries = await getAllEntries();
+    let total = entries.reduce((sum, entry) => sum + entry.size, 0);
+    if (total <= quota) return;
+
+    const cache = await caches.open(IMAGE_CACHE);
+    const candidates = entries.filter(entry => !isPinned(entry)).sort((a, b) => a.lastAccess - b.lastAccess);
+    for (const entry of candidates) {
+        if (total <= quota) break;
+        await cache.delete(entry.url);
+        await withStore('readwrite', store => store.delete(entry.url));
+        total -= entry.size;
+    }
+}
+
+// Capítulos guardados para leer sin conexión
+
+async function fetchManifest(mangaId) {
+    const apiCache = await caches.open(API_CACHE);
+    const detailUrl = `/api/mangas/${mangaId}`;
+    const imagesUrl = `/api/mangas/${mangaId}/images`;
+
+    const [detail, images] = await Promise.all([fetch(detailUrl), fetch(imagesUrl)]);
+    if (!detail.ok || !images.ok) {
+        throw new Error('No se pudo obtener el manifiesto del capítulo');
+    }
+    await apiCache.put(detailUrl, detail.clone());
+    await apiCache.put(imagesUrl, images.clone());
+
+    const shellCache = await caches.open(SHELL_CACHE);
+    const reader = await fetch(`/read/${mangaId}`);
+    if (reader.ok && !reader.redirected) {
+        await shellCache.put(`/read/${mangaId}`, reader);
+    }
+    return (await images.json()).images.map(image => new URL(image.url, self.location.origin).href);
+}
+
+async function saveChapter(mangaId, client) {
+    const notify = message => client && client.postMessage({ mangaId, ...message });
+
+    try {
+        const urls = await fetchManifest(mangaId);
+        const cache = await caches.open(IMAGE_CACHE);
+        let done = 0;
+        let failed = 0;
+        let next = 0;
+
+        // Descargar con concurrencia limitada para no saturar la conexión
+        async function worker() {
+            while (next < urls.length) {
+                const url = urls[next++];
+                try {
+                    // Solo las páginas por hash son inmutables; las demás se descargan de nuevo
+                    const immutable = BLOB_PATTERN.test(new URL(url).pathname);
+                    const cached = immutable ? await cache.match(url) : null;
+                    if (cached) {
+                        await updateEntry(url, entry => ({
+                            url,
+                            size: entry ? entry.size : 0,
+                            lastAccess: Date.now(),
+                            owners: [...new Set([...(entry ? entry.owners : []), mangaId])]
+                        }));
+                    } else {
+                        const response = await fetch(url);
+                        if (!response.ok || response.redirected) throw new Error(`HTTP ${response.status}`);
+                        await storeImage(cache, url, response, mangaId);
+                    }
+                } catch (error) {
+                    failed++;
+                }
+                done++;
+                notify({ type: 'save-progress', done, total: urls.length, failed });
+            }
+        }
+
+        await Promise.all(Array.from({ length: PREFETCH_CONCURRENCY }, worker));
+        notify({ type: 'save-complete', total: urls.length, failed });
+    } catch (error) {
+        notify({ type: 'save-error', error: error.message });
+    }
+}
+
+async function removeChapter(mangaId, client) {
+    // Las páginas que ningún otro capítulo guardado usa pasan a competir en el LRU normal
+    const entries = await getChapterEntries(mangaId);
+    for (const { url } of entries) {
+        await updateEntry(url, entry => entry && {
+            ...entry,
+            owners: entry.owners.filter(owner => owner !== mangaId)
+        });
+    }
+    scheduleEviction();
+    if (client) client.postMessage({ type: 'remove-complete', mangaId });
+}
+
+async function chapterStatus(mangaId, client) {
+    const saved = await getChapterEntries(mangaId);
+    if (client) {
+        client.postMessage({
+            type: 'chapter-status',
+            mangaId,
+            savedPages: saved.length,
+            bytes: saved.reduce((sum, entry) => sum + entry.size, 0)
+        });
+    }
+}
+
+async function clearAll() {
+    const names = await caches.keys();
+    await Promise.all(names.filter(name => name.startsWith('lectorm-')).map(name => caches.delete(name)));
+    await withStore('readwrite', store => store.clear());
+}
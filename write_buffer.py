@@ -0,0 +1,81 @@
+"""
+Escrituras agrupadas en memoria con volcado periódico por lotes
+
+Pensado para escrituras frecuentes donde solo importa el último valor por clave
+(como la posición de lectura mientras se hace scroll): las escrituras a la misma
+clave se fusionan y un hilo en segundo plano las vuelca juntas en una sola
+transacción cada pocos segundos o cuando el búfer se llena.
+"""
+
+import atexit
+import os
+import threading
+
+
+class CoalescingWriter:
+    """Búfer de escrituras por clave que se vuelca en lotes"""
+
+    def __init__(self, flush_batch, interval=2.0, max_pending=500, merge=None):
+        self.flush_batch = flush_batch
+        # merge(anterior, nuevo) combina valores (por ejemplo, sumar contadores);
+        # por defecto gana el último valor
+        self.merge = merge
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Los hilos no sobreviven al fork: cada worker arranca el suyo
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def add(self, key, value):
+        with self._lock:
+            if self.merge and key in self._pending:
+                value = self.merge(self._pending[key], value)
+            self._pending[key] = value
+            self._ensure_thread()
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Volcar todas las escrituras pendientes; devuelve cuántas se escribieron"""
+        # Un solo volcado a la vez para que un lote antiguo no pise a uno más nuevo
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self.flush_batch(batch)
+            except Exception:
+                # Reintentar en el siguiente volcado sin pisar valores más nuevos
+                with self._lock:
+                    for key, value in batch.items():
+                        if key not in self._pending:
+                            self._pending[key] = value
+                        elif self.merge:
+                            self._pending[key] = self.merge(value, self._pending[key])
+                raise
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error al volcar escrituras pendientes: {e}")